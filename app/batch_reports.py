@@ -0,0 +1,315 @@
+"""Headless report generation for a directory or manifest of datasets.
+
+Runs generate_report over a pool of processes and writes one standalone HTML report
+per dataset plus a manifest.json with timings and failures into --out. Rerunning
+into the same --out skips the datasets whose report is there and whose file hasn't
+changed, so an interrupted batch resumes where it stopped.
+
+    python -m app.batch_reports ledgers/ --out reports/
+    python -m app.batch_reports month_end.txt --out reports/ --processes 8 --rpm 5000
+
+A manifest lists one dataset path per line (relative to the manifest, '#' starts a
+comment). Reports are shared with the web app through the result cache, so a file
+already analyzed there (or in an earlier batch) is written without any LLM calls.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.llm_tools.formats import file_format
+from app.llm_tools.settings import DEFAULT_MODEL
+from app.llm_tools.llm_scheduler import REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE
+
+
+PROCESSES = min(os.cpu_count() or 1, 8) # reports built at the same time, one per process
+THREADS = 4 # concurrent agent calls within a report (generate_report max_workers)
+SANDBOX_WORKERS = 2 # python sandbox processes per batch process
+MANIFEST_NAME = 'manifest.json'
+CHART_SUBDIR = 'charts' # chart images are copied here so the reports open from disk
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+HASH_BLOCK = 1024 * 1024
+
+
+# Input: a directory (searched recursively for supported files) or a manifest file
+# Output: list of (dataset path, report name); names are the path below the
+# directory or manifest, so ledgers with the same file name in different folders don't collide
+def find_datasets(source) -> list:
+    source = Path(source)
+    if source.is_dir():
+        root = source
+        paths = sorted(path for path in source.rglob('*') if path.is_file() and file_format(path.name))
+    else:
+        root = source.parent
+        paths = []
+        for line in source.read_text().splitlines():
+            line = line.split('#', 1)[0].strip()
+            if line:
+                paths.append(root / line)
+
+    datasets = {}
+    used = set()
+    for path in paths:
+        try:
+            relative = path.resolve().relative_to(root.resolve())
+        except ValueError: # manifest entry outside the manifest's folder
+            relative = Path(path.name)
+        name = '__'.join(relative.with_suffix('').parts)
+        if name in used: # a.csv next to a.parquet
+            name = '__'.join(relative.parts).replace('.', '_')
+        if path not in datasets:
+            used.add(name)
+            datasets[path] = name
+    return list(datasets.items())
+
+
+def _file_hash(path) -> str:
+    # same digest as ingest.spool_upload, so batch and web uploads share cache entries
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, data: str):
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_text(data, encoding='utf-8')
+    os.replace(tmp_path, path) # an interrupted batch never leaves a half written report
+
+
+# Output: report html with its /charts/ urls pointing at copies in out_dir/charts
+def _localize_charts(html: str, out_dir: Path) -> str:
+    from app.llm_tools.chart_store import CHART_DIR, CHART_URL_PREFIX
+
+    chart_dir = out_dir / CHART_SUBDIR
+
+    def copy_chart(match):
+        name = match.group(1)
+        target = chart_dir / name
+        if not target.exists():
+            chart_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = chart_dir / f'.{name}.{os.getpid()}.tmp'
+            try:
+                shutil.copyfile(CHART_DIR / name, tmp_path)
+            except FileNotFoundError:
+                return match.group(0)
+            os.replace(tmp_path, target)
+        return f'{CHART_SUBDIR}/{name}'
+
+    return re.sub(re.escape(CHART_URL_PREFIX) + r'([0-9a-f]+\.\w+)', copy_chart, html)
+
+
+def _render_page(summary: str, name: str, source: str) -> str:
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape())
+    return env.get_template('batch_report.html').render(
+        summary=summary, name=name, source=source, generated=time.strftime('%Y-%m-%d %H:%M'),
+    )
+
+
+def _init_worker(options, setup):
+    from app.llm_tools import sandbox, chart_render
+    from app.llm_tools.llm_scheduler import scheduler
+    sandbox.SANDBOX_WORKERS = options['sandbox_workers']
+    # charts are drawn in the batch process itself: the batch already runs one report per
+    # process, and a pool process can't exit while a render pool it started is still up
+    chart_render.RENDER_PROCESSES = 0
+    # every process gets its share of the account limits, together they stay under them
+    scheduler.set_limits(options['requests_per_minute'], options['tokens_per_minute'])
+    if setup is not None:
+        setup()
+
+
+# Runs in a pool process.
+# Output: manifest entry of the dataset (status 'done' or 'failed', timings, tokens)
+def build_report(source, name, out_dir, options) -> dict:
+    from app import result_cache
+    from app.llm_tools.ingest import read_table
+    from app.llm_tools.metrics import Trace
+    from app.llm_tools.finai_llm import generate_report
+
+    start = time.perf_counter()
+    entry = {'source': str(source), 'status': 'failed', 'cached': False, 'rows': None, 'pid': os.getpid()}
+    trace = Trace('batch', dataset=name, model=options['model'])
+    try:
+        cache_key = result_cache.make_key('report', _file_hash(source), options['model'])
+        report = None if options['force'] else result_cache.get(cache_key, 'report')
+        entry['cached'] = report is not None
+        if report is None:
+            with trace.stage('ingest'):
+                df = read_table(source)
+            entry['rows'] = len(df)
+            report = generate_report(df, model=options['model'], max_workers=options['threads'],
+                                     plot_mode=options['plot_mode'], trace=trace)
+            result_cache.put(cache_key, 'report', report)
+        html_path = Path(out_dir) / f'{name}.html'
+        _write_atomic(html_path, _render_page(_localize_charts(report, Path(out_dir)), name, str(source)))
+    except Exception as e:
+        traceback.print_exc()
+        trace.finish('failed')
+        entry['error'] = f'{type(e).__name__}: {e}'
+    else:
+        trace.finish()
+        entry.update(status='done', html=html_path.name)
+
+    summary = trace.to_dict()
+    stages = {}
+    for span in summary['stages']:
+        # concurrent stages (q-a) are summed, so this is work, not wall time
+        stages[span['stage']] = round(stages.get(span['stage'], 0.0) + span['seconds'], 4)
+    entry.update(
+        seconds=round(time.perf_counter() - start, 4),
+        stage_seconds=stages,
+        prompt_tokens=summary['prompt_tokens'],
+        completion_tokens=summary['completion_tokens'],
+        cost_usd=summary['cost_usd'],
+    )
+    return entry
+
+
+def load_manifest(out_dir: Path) -> dict:
+    path = out_dir / MANIFEST_NAME
+    if path.exists():
+        return json.loads(path.read_text())
+    return {'reports': {}}
+
+
+def _save_manifest(out_dir: Path, manifest: dict):
+    reports = manifest['reports'].values()
+    done = [entry for entry in reports if entry['status'] == 'done']
+    manifest['totals'] = {
+        'datasets': len(manifest['reports']),
+        'done': len(done),
+        'failed': len(reports) - len(done),
+        'cached': sum(1 for entry in done if entry.get('cached')),
+        'report_seconds': round(sum(entry.get('seconds') or 0.0 for entry in reports), 4),
+        'cost_usd': round(sum(entry.get('cost_usd') or 0.0 for entry in reports), 6),
+    }
+    _write_atomic(out_dir / MANIFEST_NAME, json.dumps(manifest, indent=2))
+
+
+def _file_state(path: Path) -> dict:
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+# a dataset is finished when its report exists and the file is the one it was built from
+def _is_finished(entry, path: Path, out_dir: Path) -> bool:
+    if not entry or entry['status'] != 'done' or not (out_dir / entry['html']).exists():
+        return False
+    return {'size': entry.get('size'), 'mtime': entry.get('mtime')} == _file_state(path)
+
+
+# Input: find_datasets output and the output folder; requests/tokens per minute are the
+# account limits shared by all processes. setup() runs in every pool process before
+# its first report (e.g. to swap the chat model).
+# Output: the manifest (also written to out_dir/manifest.json after every report)
+def run_batch(datasets, out_dir, processes=PROCESSES, threads=THREADS, model=DEFAULT_MODEL, plot_mode='rules',
+              requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+              sandbox_workers=SANDBOX_WORKERS, force=False, setup=None, log=print) -> dict:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    reports = manifest['reports']
+
+    pending = []
+    for path, name in datasets:
+        if not path.is_file() or not file_format(path.name):
+            reports[name] = {'source': str(path), 'status': 'failed', 'error': 'Missing or unsupported file'}
+        elif force or not _is_finished(reports.get(name), path, out_dir):
+            pending.append((path, name))
+    log(f'{len(pending)} of {len(datasets)} datasets to build, {len(datasets) - len(pending)} already done or skipped')
+
+    processes = max(1, min(processes, len(pending)))
+    options = {
+        'model': model,
+        'threads': threads,
+        'plot_mode': plot_mode,
+        'sandbox_workers': sandbox_workers,
+        'force': force, # also skips reports of the same file in the result cache
+        'requests_per_minute': requests_per_minute / processes,
+        'tokens_per_minute': tokens_per_minute / processes,
+    }
+    manifest['options'] = dict(options, processes=processes)
+    manifest['started'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    start = time.perf_counter()
+
+    pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(options, setup),
+    )
+    try:
+        futures = {}
+        for path, name in pending:
+            state = _file_state(path)
+            futures[pool.submit(build_report, str(path), name, str(out_dir), options)] = (name, state)
+        for count, future in enumerate(as_completed(futures), start=1):
+            name, state = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e: # the pool process died, e.g. killed for memory
+                entry = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+            reports[name] = dict(entry, **state)
+            _save_manifest(out_dir, manifest)
+            log(f"[{count}/{len(pending)}] {name}: {entry['status']} in {entry.get('seconds', 0):.1f}s"
+                + (f" ({entry['error']})" if entry['status'] == 'failed' else ''))
+    except KeyboardInterrupt:
+        log('Interrupted, finished reports are kept and skipped on the next run')
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        manifest['wall_seconds'] = round(time.perf_counter() - start, 4)
+        manifest['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        _save_manifest(out_dir, manifest)
+    pool.shutdown()
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='folder of datasets or a manifest file listing them')
+    parser.add_argument('--out', required=True, help='folder for the reports, charts and manifest.json')
+    parser.add_argument('--processes', type=int, default=PROCESSES, help='reports built at the same time')
+    parser.add_argument('--threads', type=int, default=THREADS, help='concurrent agent calls per report')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--plot-mode', default='rules', choices=['rules', 'agent'])
+    parser.add_argument('--rpm', type=int, default=REQUESTS_PER_MINUTE, help='API requests per minute of the key, split between processes')
+    parser.add_argument('--tpm', type=int, default=TOKENS_PER_MINUTE, help='API tokens per minute of the key, split between processes')
+    parser.add_argument('--sandbox-workers', type=int, default=SANDBOX_WORKERS, help='python sandbox processes per process')
+    parser.add_argument('--force', action='store_true', help='rebuild every report, even done or cached ones')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.source):
+        parser.error(f'{args.source} does not exist')
+
+    datasets = find_datasets(args.source)
+    if not datasets:
+        print(f'No datasets found in {args.source}', file=sys.stderr)
+        return 1
+    log = lambda message: print(message, file=sys.stderr)
+    try:
+        manifest = run_batch(
+            datasets, args.out, processes=args.processes, threads=args.threads, model=args.model,
+            plot_mode=args.plot_mode, requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+            sandbox_workers=args.sandbox_workers, force=args.force, log=log,
+        )
+    except KeyboardInterrupt:
+        return 130
+    totals = manifest['totals']
+    log(f"{totals['done']} reports done, {totals['failed']} failed in {manifest['wall_seconds']:.1f}s, "
+        f"manifest in {Path(args.out) / MANIFEST_NAME}")
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
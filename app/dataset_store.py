@@ -0,0 +1,105 @@
+import time
+import uuid
+from pathlib import Path
+from threading import Lock
+from collections import OrderedDict
+
+
+MAX_DATASET_BYTES = 1024 * 1024 * 1024 # parsed frames kept in memory across all sessions
+DATASET_TTL = 30 * 60 # seconds a dataset may sit idle before it is dropped
+# least recently used frames are written here instead of being dropped, None disables spilling
+SPILL_DIR = Path(__file__).resolve().parent.parent / 'instance' / 'datasets'
+
+_datasets = OrderedDict() # dataset_id -> entry, least recently used first
+_lock = Lock()
+
+
+def _frame_bytes(df) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _spill(dataset_id, entry):
+    # parquet needs pyarrow, without it the frame is simply dropped
+    if SPILL_DIR is None:
+        return False
+    try:
+        SPILL_DIR.mkdir(parents=True, exist_ok=True)
+        path = SPILL_DIR / f'{dataset_id}.parquet'
+        entry['df'].to_parquet(path)
+    except Exception as e:
+        print(f'Could not spill dataset {dataset_id}: {e}')
+        return False
+    entry['spill_path'] = path
+    return True
+
+
+def _remove(dataset_id):
+    entry = _datasets.pop(dataset_id)
+    if entry['spill_path'] is not None:
+        entry['spill_path'].unlink(missing_ok=True)
+
+
+def _in_memory_bytes():
+    return sum(entry['nbytes'] for entry in _datasets.values() if entry['df'] is not None)
+
+
+# called with _lock held
+def _enforce_limits(keep_id=None):
+    now = time.time()
+    for dataset_id in [key for key, entry in _datasets.items() if now - entry['last_used'] > DATASET_TTL]:
+        _remove(dataset_id)
+
+    total = _in_memory_bytes()
+    for dataset_id, entry in list(_datasets.items()):
+        if total <= MAX_DATASET_BYTES:
+            break
+        if dataset_id == keep_id or entry['df'] is None:
+            continue
+        if not _spill(dataset_id, entry):
+            _remove(dataset_id)
+        else:
+            entry['df'] = None
+        total -= entry['nbytes']
+
+
+# Input: parsed dataframe and the session's user; record_id is the dataset's row in the history tables
+# Output: dataset id (str) to send with later chat turns
+def add_dataset(df, user_id=None, filename=None, file_hash=None, record_id=None):
+    dataset_id = uuid.uuid4().hex
+    with _lock:
+        _datasets[dataset_id] = {
+            'id': dataset_id,
+            'df': df,
+            'user_id': user_id,
+            'filename': filename,
+            'file_hash': file_hash,
+            'record_id': record_id,
+            'nbytes': _frame_bytes(df),
+            'spill_path': None,
+            'last_used': time.time(),
+        }
+        _enforce_limits(keep_id=dataset_id)
+    return dataset_id
+
+
+# Output: entry dict with the loaded 'df', None if unknown, expired or owned by another user
+def get_dataset(dataset_id, user_id=None):
+    with _lock:
+        _enforce_limits(keep_id=dataset_id)
+        entry = _datasets.get(dataset_id)
+        if entry is None or entry['user_id'] != user_id:
+            return None
+        if entry['df'] is None:
+            import pandas as pd # imported on use, the auth routes load this module too
+            entry['df'] = pd.read_parquet(entry['spill_path'])
+        entry['last_used'] = time.time()
+        _datasets.move_to_end(dataset_id)
+        _enforce_limits(keep_id=dataset_id)
+        return dict(entry)
+
+
+# drops every dataset of a user, e.g. on logout
+def drop_user_datasets(user_id):
+    with _lock:
+        for dataset_id in [key for key, entry in _datasets.items() if entry['user_id'] == user_id]:
+            _remove(dataset_id)
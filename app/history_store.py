@@ -0,0 +1,83 @@
+import zlib
+import base64
+from datetime import datetime
+
+from sqlalchemy import LargeBinary, and_, or_
+from sqlalchemy.types import TypeDecorator
+
+
+COMPRESS_LEVEL = 6 # zlib level of stored report and answer html, html shrinks ~5-10x
+HISTORY_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# applied to every new connection of FinAI.sqlite3: WAL lets history reads run while a
+# report worker writes, NORMAL sync is safe under WAL and skips an fsync per commit
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000, # ms a writer waits for the lock instead of failing with "database is locked"
+    'cache_size': -64000, # negative is KiB, 64 MB page cache per connection
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+class CompressedText(TypeDecorator):
+    """Text stored zlib compressed in a BLOB column, read back as str."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.compress(value.encode('utf-8'), COMPRESS_LEVEL)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return zlib.decompress(value).decode('utf-8')
+
+
+# listener for the engine's 'connect' event
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{row_id}'.encode()).decode()
+
+
+# Output: (created_at, id) of a cursor, ValueError when it is malformed
+def decode_cursor(cursor: str):
+    try:
+        created, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def page_size(limit) -> int:
+    return max(1, min(limit or HISTORY_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+# Input: query over model (already filtered to one user), the cursor returned with the
+# previous page (None for the first one) and the page size
+# Output: (rows newest first, cursor of the next page or None after the last one).
+# Keyset pagination: the page starts right after the cursor on the (user, created_at)
+# index, so deep pages cost the same as the first one, unlike OFFSET.
+def paginate(query, model, cursor=None, limit=HISTORY_PAGE_SIZE):
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
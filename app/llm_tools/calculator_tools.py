@@ -0,0 +1,33 @@
+from typing import Dict, Optional
+
+from langchain_core.tools import tool
+
+from .fin_calc import FORMULAS, calculate, calculate_frame, describe_results
+
+
+FORMULA_LIST = '; '.join(f'{key} = {name} ({", ".join(inputs)})' for key, (name, inputs, _, _) in FORMULAS.items())
+
+CALCULATOR_DESCRIPTION = (
+    "Standard finance formulas computed over whole columns of df at once, faster and safer "
+    "than writing the math in python. Give the formula key, `columns` mapping each input to "
+    "a column of df and `constants` for inputs that are the same number on every row "
+    "(rates are percentages, e.g. 5 for 5%). Without any columns it computes a single value. "
+    f"Formulas (inputs): {FORMULA_LIST}."
+)
+
+
+# Output: tools for bind_pandas_agent(extra_tools=...) working on injected_df
+def make_calculator_tools(injected_df):
+    @tool(description=CALCULATOR_DESCRIPTION)
+    def financial_calculator(formula: str, columns: Optional[Dict[str, str]] = None,
+                             constants: Optional[Dict[str, float]] = None) -> str:
+        try:
+            if not columns and constants and len(constants) == len(FORMULAS.get(formula, ('', ()))[1]):
+                name = FORMULAS[formula][0]
+                return f'{name}: {float(calculate(formula, **constants)):.4f}'
+            results = calculate_frame(injected_df, formula, columns, constants)
+            return describe_results(formula, results)
+        except ValueError as e:
+            return f'Calculation failed: {e}'
+
+    return [financial_calculator]
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+# charts are drawn from these reduced views, so render time doesn't grow with the row count
+MAX_BINS = 30
+MAX_LINE_POINTS = 2_000 # line plots are downsampled with LTTB above this
+MAX_SCATTER_POINTS = 5_000 # scatter plots draw a random sample of this size
+MAX_FLIERS = 50 # outliers drawn per box, the most extreme ones first
+
+
+# Input: numeric series (missing values are ignored)
+# Output: (counts, edges) of a Freedman-Diaconis histogram with at most max_bins bins
+def histogram_bins(series: pd.Series, max_bins=MAX_BINS):
+    values = series.dropna().to_numpy(dtype=float)
+    if len(values) == 0:
+        return np.zeros(1, dtype=int), np.array([0.0, 1.0])
+    q25, q75 = np.percentile(values, [25, 75])
+    bin_width = 2 * (q75 - q25) / (len(values) ** (1/3))
+    low, high = values.min(), values.max()
+    if bin_width > 0:
+        bins = int((high - low) / bin_width)
+    else:
+        # no spread between the quartiles, one bin per distinct value up to max_bins
+        bins = len(np.unique(values[:10_000]))
+    counts, edges = np.histogram(values, bins=max(1, min(bins, max_bins)))
+    return counts, edges
+
+
+# Input: frame, grouping column, numeric column and the groups to keep (in display order)
+# Output: list of per-group stat dicts in the layout Axes.bxp draws (1.5 IQR whiskers)
+def box_stats(df: pd.DataFrame, category_col: str, numeric_col: str, categories) -> list:
+    groups = df.groupby(category_col, observed=True, sort=False)[numeric_col]
+    stats = []
+    present = groups.groups
+    for category in categories:
+        if category not in present:
+            continue # unused level of a categorical column
+        values = groups.get_group(category).to_numpy(dtype=float)
+        q1, med, q3 = np.percentile(values, [25, 50, 75])
+        iqr = q3 - q1
+        inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+        fliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+        if len(fliers) > MAX_FLIERS:
+            # keep the points furthest from the median, they are the ones a reader looks for
+            fliers = fliers[np.argsort(np.abs(fliers - med))[-MAX_FLIERS:]]
+        stats.append({
+            'label': str(category),
+            'med': med,
+            'q1': q1,
+            'q3': q3,
+            'whislo': inside.min() if len(inside) else q1,
+            'whishi': inside.max() if len(inside) else q3,
+            'fliers': fliers,
+        })
+    return stats
+
+
+# Output: (labels, means) of y_col per x_col value, the bars seaborn's barplot would draw
+def bar_means(df: pd.DataFrame, x_col: str, y_col: str):
+    means = df.groupby(x_col, observed=True, sort=True)[y_col].mean()
+    return [str(label) for label in means.index], means.to_numpy()
+
+
+def _as_numbers(values: np.ndarray) -> np.ndarray:
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return values.astype(float)
+
+
+# Largest-Triangle-Three-Buckets: keeps the points that shape the line
+# Input: x, y arrays (x sorted) and the number of points to keep
+# Output: indices of the kept points
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = _as_numbers(x)
+    y = y.astype(float)
+
+    # first and last points are always kept, the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # the next bucket is represented by its average point
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+
+# Input: frame sorted by x_col
+# Output: at most max_points rows that keep the shape of the y_col line
+def downsample_line(df: pd.DataFrame, x_col: str, y_col: str, max_points=MAX_LINE_POINTS) -> pd.DataFrame:
+    if len(df) <= max_points:
+        return df
+    x = df[x_col].to_numpy()
+    if pd.api.types.is_numeric_dtype(df[x_col]) or pd.api.types.is_datetime64_any_dtype(df[x_col]):
+        return df.iloc[lttb_indices(x, df[y_col].to_numpy(), max_points)]
+    # text x axes have no distance to measure, keep evenly spaced rows
+    return df.iloc[np.linspace(0, len(df) - 1, max_points).astype(int)]
+
+
+# Output: random sample of at most max_points rows (seeded so a report's charts are stable)
+def downsample_points(df: pd.DataFrame, max_points=MAX_SCATTER_POINTS) -> pd.DataFrame:
+    if len(df) <= max_points:
+        return df
+    return df.sample(n=max_points, random_state=0)
@@ -0,0 +1,114 @@
+import re
+
+import pandas as pd
+
+
+NUM_CHARTS = 2 # the report places one chart after the overview and one before the insights
+MAX_BOX_CATEGORIES = 30 # categoricals with more distinct values make poor x axes
+MAX_MISSING_SHARE = 0.5 # columns missing more than this share of rows are not charted
+# key columns by name: id, account_id, cost-code, AccountID, ProductCode
+ID_NAME = re.compile(r'(?i:(^|[_\s-])(id|code|key)$)|[a-z](Id|ID|Code|Key)$')
+
+
+def _missing_share(column: dict, n_rows: int) -> float:
+    return 1 - column['count'] / n_rows if n_rows else 1.0
+
+
+def _is_identifier(df: pd.DataFrame, col: str, column: dict) -> bool:
+    # integer columns where (almost) every value is distinct are row ids, and key columns
+    # (account_id with 40 accounts) are labels: neither is a measure to sum or average
+    if ID_NAME.search(str(col)):
+        return True
+    return pd.api.types.is_integer_dtype(df[col]) and column['p_distinct'] > 0.95
+
+
+# Output: numeric columns worth charting, best first
+def _numeric_columns(df: pd.DataFrame, variables: dict, n_rows: int) -> list:
+    candidates = [
+        (col, column) for col, column in variables.items()
+        if column['type'] == 'Numeric'
+        and column['n_distinct'] > 1
+        and _missing_share(column, n_rows) <= MAX_MISSING_SHARE
+        and not _is_identifier(df, col, column)
+    ]
+    # amounts are usually floats and integer columns are often codes, so floats first,
+    # then spread out, complete columns
+    candidates.sort(key=lambda item: (
+        not pd.api.types.is_float_dtype(df[item[0]]),
+        _missing_share(item[1], n_rows),
+        -item[1]['n_distinct'],
+    ))
+    return [col for col, _ in candidates]
+
+
+# Output: categorical columns worth grouping by, best first
+def _category_columns(variables: dict, n_rows: int) -> list:
+    candidates = [
+        (col, column) for col, column in variables.items()
+        if column['type'] in ('Categorical', 'Boolean')
+        and 1 < column['n_distinct'] <= MAX_BOX_CATEGORIES
+        and _missing_share(column, n_rows) <= MAX_MISSING_SHARE
+    ]
+    # a handful of well populated groups reads best, so prefer low cardinality then completeness
+    candidates.sort(key=lambda item: (item[1]['n_distinct'] > 10, _missing_share(item[1], n_rows), item[1]['n_distinct']))
+    return [col for col, _ in candidates]
+
+
+# Input: dataframe and its profile_dataframe() output
+# Output: ordered list of (tool name, tool arguments) candidates; run_chart_plan
+# draws them in order until it has num_charts charts, so later entries are fallbacks
+def plan_charts(df: pd.DataFrame, profile: dict) -> list:
+    variables = profile['variables']
+    n_rows = profile['table']['n']
+    numeric = _numeric_columns(df, variables, n_rows)
+    categories = _category_columns(variables, n_rows)
+
+    plan = []
+    if numeric and categories:
+        plan.append(('top_category_boxplot', {
+            'title': f'{numeric[0]} by {categories[0]}',
+            'description': f'Spread of {numeric[0]} across the most frequent {categories[0]} values.',
+            'category_col': categories[0],
+            'numeric_col': numeric[0],
+        }))
+        # a second pair keeps the two charts from showing the same columns
+        bar_numeric = numeric[1] if len(numeric) > 1 else numeric[0]
+        bar_category = categories[1] if len(categories) > 1 else categories[0]
+        plan.append(('bar_plot', {
+            'title': f'{bar_numeric} by {bar_category}',
+            'description': f'{bar_numeric} for each {bar_category} value.',
+            'x_col': bar_category,
+            'y_col': bar_numeric,
+        }))
+    for col in numeric[:2]:
+        plan.append(('histogram_plot', {
+            'title': f'Distribution of {col}',
+            'description': f'How the values of {col} are distributed.',
+            'col': col,
+        }))
+    for col in categories[:2]:
+        plan.append(('top_frequency_barplot', {
+            'title': f'Most frequent {col} values',
+            'description': f'Row counts of the most common {col} values.',
+            'category_col': col,
+        }))
+    return plan
+
+
+# Input: plan from plan_charts, tools from make_plotting_tools and the plot_sink they append to
+# Output: number of charts drawn; tools are called directly, without an LLM round trip
+def run_chart_plan(plan: list, tools: list, plot_sink: list, num_charts=NUM_CHARTS) -> int:
+    tools_by_name = {tool.name: tool for tool in tools}
+    drawn = 0
+    for name, args in plan:
+        if drawn >= num_charts:
+            break
+        if name not in tools_by_name:
+            continue
+        before = len(plot_sink)
+        tools_by_name[name].invoke(args)
+        if len(plot_sink) > before:
+            drawn += 1
+        else:
+            print(f'Chart planner: {name} failed for {args["title"]}')
+    return drawn
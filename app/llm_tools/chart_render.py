@@ -0,0 +1,159 @@
+from io import BytesIO
+from threading import Lock
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+# charts are drawn in worker processes so reports render in parallel without sharing
+# matplotlib state; 0 draws them on the calling thread instead
+RENDER_PROCESSES = 2
+PALETTE = 'tab10'
+
+_pool = None
+_pool_lock = Lock()
+_inline_ready = False
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+    import seaborn as sns
+    sns.set_palette(PALETTE)
+
+
+def _new_axes(spec):
+    fig = Figure(figsize=spec.get('figsize'))
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+# drawers take the reduced data built by chart_data, never a full column
+
+def _draw_scatter(ax, spec):
+    data = spec['data']
+    ax.scatter(data[spec['x']], data[spec['y']], s=12, alpha=0.7)
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel(spec['y'])
+
+
+def _draw_line(ax, spec):
+    data = spec['data']
+    ax.plot(data[spec['x']], data[spec['y']])
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel(spec['y'])
+
+
+def _draw_bar(ax, spec):
+    labels = spec['labels']
+    ax.bar(labels, spec['values'], color=[f'C{i}' for i in range(len(labels))])
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel(spec['y'])
+
+
+def _draw_stacked_bar(ax, spec):
+    import seaborn as sns
+    sns.barplot(
+        data=spec['data'],
+        x=spec['x'],
+        y=spec['y'],
+        hue=spec['stack'],
+        estimator=sum,
+        errorbar=None,
+        dodge=False,
+        ax=ax
+    )
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.legend(title=spec['stack'], bbox_to_anchor=(1.05, 1), loc='upper left')
+
+
+def _draw_histogram(ax, spec):
+    edges = spec['edges']
+    ax.stairs(spec['counts'], edges, fill=True, alpha=0.75, edgecolor='white')
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel('Count')
+
+
+def _draw_category_counts(ax, spec):
+    ax.bar(spec['labels'], spec['counts'])
+    if spec.get('other'):
+        ax.bar('Other', spec['other'])
+
+
+def _draw_frequency_bar(ax, spec):
+    import seaborn as sns
+    sns.barplot(data=spec['data'], x=spec['x'], y='count', hue=spec['x'], errorbar=None, ax=ax)
+
+
+def _draw_box(ax, spec):
+    boxes = ax.bxp(spec['stats'], patch_artist=True)
+    for i, box in enumerate(boxes['boxes']):
+        box.set_facecolor(f'C{i}')
+    ax.set_xlabel(spec['x'])
+    ax.set_ylabel(spec['y'])
+
+
+_DRAWERS = {
+    'scatter': _draw_scatter,
+    'line': _draw_line,
+    'bar': _draw_bar,
+    'stacked_bar': _draw_stacked_bar,
+    'histogram': _draw_histogram,
+    'category_counts': _draw_category_counts,
+    'frequency_bar': _draw_frequency_bar,
+    'box': _draw_box,
+}
+
+
+# Input: chart spec dict ('kind', 'title', plus the kind's data fields), image format and dpi
+# Output: encoded image; uses only the object oriented Agg API, never pyplot's global figure
+def render_chart(spec, fmt='png', dpi=100) -> bytes:
+    fig, ax = _new_axes(spec)
+    _DRAWERS[spec['kind']](ax, spec)
+    ax.set_title(spec['title'])
+    ax.tick_params(axis='x', labelrotation=90)
+    buf = BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _render_inline(spec, fmt, dpi) -> bytes:
+    global _inline_ready
+    if not _inline_ready:
+        _init_worker()
+        _inline_ready = True
+    return render_chart(spec, fmt, dpi)
+
+
+# Output: encoded image of the chart, drawn on the render pool when there is one
+def render(spec, fmt='png', dpi=100) -> bytes:
+    if RENDER_PROCESSES <= 0:
+        return _render_inline(spec, fmt, dpi)
+    try:
+        return _get_pool().submit(render_chart, spec, fmt, dpi).result()
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory), start a fresh pool next time
+        _reset_pool()
+        return _render_inline(spec, fmt, dpi)
@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+from threading import Lock
+
+
+# rendered charts are stored once under their content hash and served by the /charts route
+CHART_DIR = Path(__file__).resolve().parent.parent.parent / 'instance' / 'charts'
+CHART_URL_PREFIX = '/charts/'
+CHART_FORMAT = 'png' # 'png', 'webp' (needs Pillow) or 'svg'
+CHART_DPI = 100
+MAX_CHART_BYTES = 1024 * 1024 * 1024 # least recently used charts nothing refers to are deleted past this size
+CHART_MIN_AGE = 2 * 60 * 60 # seconds a chart is kept regardless, reports still running or on screen use it
+PRUNE_INTERVAL = 10 * 60 # seconds between size checks of CHART_DIR
+CHART_NAME = re.compile(r'/charts/([0-9a-f]{32}\.(?:png|webp|svg))')
+
+MIMETYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+}
+
+
+_reference_sources = []
+_prune_lock = Lock()
+_last_prune = 0.0
+
+
+# Input: callable returning the texts (html or markdown) whose chart urls must stay
+# served, e.g. cached reports and history rows. Only a process that registered its
+# sources prunes, so the batch runner and worker processes never delete charts.
+def add_reference_source(source):
+    _reference_sources.append(source)
+
+
+def chart_names(text) -> set:
+    return set(CHART_NAME.findall(text or ''))
+
+
+# Input: encoded image and its format
+# Output: url of the stored file; identical charts share one file
+def save_chart(image: bytes, fmt=CHART_FORMAT) -> str:
+    name = f'{hashlib.sha256(image).hexdigest()[:32]}.{fmt}'
+    path = CHART_DIR / name
+    try:
+        os.utime(path) # reused charts count as recently used
+    except FileNotFoundError:
+        CHART_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CHART_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path) # atomic, concurrent reports never see a half written file
+        _maybe_prune()
+    return CHART_URL_PREFIX + name
+
+
+def _maybe_prune():
+    global _last_prune
+    if not _reference_sources or time.time() - _last_prune < PRUNE_INTERVAL:
+        return
+    if not _prune_lock.acquire(blocking=False): # another thread is already pruning
+        return
+    try:
+        _last_prune = time.time()
+        prune_charts()
+    except Exception as e: # a failed sweep must not fail the report that saved the chart
+        print(f'Chart pruning failed: {e}')
+    finally:
+        _prune_lock.release()
+
+
+# Output: number of charts deleted. Past max_bytes, the least recently used charts are
+# deleted until CHART_DIR fits again, skipping those younger than CHART_MIN_AGE and
+# those any reference source still links to.
+def prune_charts(max_bytes=MAX_CHART_BYTES) -> int:
+    try:
+        entries = [entry for entry in os.scandir(CHART_DIR) if CHART_NAME.fullmatch(CHART_URL_PREFIX + entry.name)]
+    except FileNotFoundError:
+        return 0
+    stats = sorted(((entry.stat(), entry) for entry in entries), key=lambda item: item[0].st_mtime)
+    total = sum(stat.st_size for stat, _ in stats)
+    if total <= max_bytes:
+        return 0
+
+    referenced = set()
+    for source in _reference_sources:
+        for text in source():
+            referenced |= chart_names(text)
+    cutoff = time.time() - CHART_MIN_AGE
+    deleted = 0
+    for stat, entry in stats:
+        if total <= max_bytes or stat.st_mtime > cutoff:
+            break
+        if entry.name in referenced:
+            continue
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+        total -= stat.st_size
+        deleted += 1
+    return deleted
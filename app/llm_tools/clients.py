@@ -0,0 +1,199 @@
+import time
+import weakref
+from threading import Lock
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+from langchain.agents import AgentType, AgentExecutor, create_tool_calling_agent
+from langchain_experimental.agents import create_pandas_dataframe_agent
+
+from .sandbox import make_python_tool
+from .metrics import LLM_BACKOFFS
+from .llm_scheduler import scheduler, estimate_tokens, backoff_delay, retry_after, MAX_ATTEMPTS
+
+
+# one keep-alive connection pool shared by every ChatOpenAI in the process
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 120 # seconds an idle connection stays open
+REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+
+# Output: why error is worth retrying ('rate_limit', 'connection', 'server'), None if it isn't
+def _retry_reason(error):
+    if isinstance(error, openai.RateLimitError):
+        return 'rate_limit'
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return 'connection'
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return 'server'
+    return None
+
+
+def _used_tokens(message):
+    usage = getattr(message, 'usage_metadata', None)
+    return usage.get('total_tokens') if usage else None
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose calls wait for llm_scheduler before going out.
+
+    Retries are done here rather than by the openai client, so every attempt is
+    admitted by the scheduler and a 429 pauses all calls for its Retry-After.
+    """
+
+    max_retries: int = 0
+
+    def _call_with_backoff(self, messages, send):
+        reserved = estimate_tokens(messages, self.max_tokens)
+        for attempt in range(MAX_ATTEMPTS):
+            scheduler.acquire(reserved)
+            try:
+                return reserved, send()
+            except Exception as e:
+                scheduler.settle(reserved, 0) # a failed call used no tokens
+                reason = _retry_reason(e)
+                if reason is None or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                LLM_BACKOFFS.inc(reason=reason)
+                wait = retry_after(e)
+                if reason == 'rate_limit':
+                    scheduler.pause(backoff_delay(attempt, wait))
+                else:
+                    time.sleep(backoff_delay(attempt, wait))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # ChatOpenAI streams through _stream, which is scheduled below
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        reserved, result = self._call_with_backoff(
+            messages, lambda: super(ScheduledChatOpenAI, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+        used = _used_tokens(result.generations[0].message) if result.generations else None
+        scheduler.settle(reserved, reserved if used is None else used)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # only the request and its first chunk are retried, a stream that broke
+        # halfway has already reached the callbacks
+        def start():
+            chunks = super(ScheduledChatOpenAI, self)._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return chunks, next(chunks, None)
+
+        reserved, (chunks, first) = self._call_with_backoff(messages, start)
+        used = None
+        try:
+            if first is None:
+                return
+            used = _used_tokens(first.message)
+            yield first
+            for chunk in chunks:
+                used = _used_tokens(chunk.message) or used
+                yield chunk
+        finally:
+            scheduler.settle(reserved, reserved if used is None else used)
+
+
+_lock = Lock()
+_http_client = None
+_chat_models = {} # (model, settings) -> ChatOpenAI
+_tool_agents = {} # (llm, prompt, tool names) -> tool calling agent runnable
+_pandas_agents = {} # (llm, df, extra tool names) -> pandas agent runnable, dropped when the df is garbage collected
+_model_factory = ScheduledChatOpenAI # replaced by set_chat_model_factory (e.g. bench/ uses a local fake model)
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=REQUEST_TIMEOUT,
+            )
+        return _http_client
+
+
+# Input: callable taking ChatOpenAI's keyword arguments (model, api_key, http_client, ...),
+# None restores ScheduledChatOpenAI. Pooled models and the agents built on them are dropped.
+def set_chat_model_factory(factory=None):
+    global _model_factory
+    with _lock:
+        _model_factory = factory or ScheduledChatOpenAI
+        _chat_models.clear()
+        _tool_agents.clear()
+        _pandas_agents.clear()
+
+
+# Input: model name, api key and any other ChatOpenAI settings (e.g. streaming=True)
+# Output: a ChatOpenAI shared by every caller asking for the same settings.
+# ChatOpenAI holds no per-call state, so the instance is safe to use from several threads.
+def get_chat_model(model, api_key, **settings) -> ChatOpenAI:
+    key = (model, api_key, tuple(sorted(settings.items())))
+    llm = _chat_models.get(key)
+    if llm is not None:
+        return llm
+    http_client = get_http_client()
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = _model_factory(
+                model=model,
+                api_key=api_key,
+                http_client=http_client,
+                **settings
+            )
+        return _chat_models[key]
+
+
+# Input: pooled llm, a module level prompt and tools bound to the current data
+# Output: AgentExecutor running the tools.
+# The agent itself only needs the tool schemas, which don't change with the data,
+# so it is built once and later calls only wrap it with the new tools.
+def bind_tool_calling_agent(llm, prompt, tools, **executor_kwargs) -> AgentExecutor:
+    key = (id(llm), id(prompt), tuple(tool.name for tool in tools))
+    agent = _tool_agents.get(key)
+    if agent is None:
+        agent = create_tool_calling_agent(llm, tools, prompt)
+        with _lock:
+            agent = _tool_agents.setdefault(key, agent)
+    return AgentExecutor(agent=agent, tools=tools, verbose=True, **executor_kwargs)
+
+
+def _pandas_agent(llm, df, extra_tools):
+    key = (id(llm), id(df), tuple(tool.name for tool in extra_tools))
+    agent = _pandas_agents.get(key)
+    if agent is not None:
+        return agent
+    # the prompt embeds df.head(), so the agent is built once per dataframe
+    agent = create_pandas_dataframe_agent(
+        llm,
+        df,
+        allow_dangerous_code=True,
+        agent_type=AgentType.OPENAI_FUNCTIONS,
+        extra_tools=extra_tools,
+    ).agent
+    try:
+        weakref.finalize(df, _pandas_agents.pop, key, None)
+    except TypeError:
+        return agent
+    with _lock:
+        return _pandas_agents.setdefault(key, agent)
+
+
+# Input: pooled llm and the dataframe to analyse
+# Output: AgentExecutor with its own python tool, so concurrent calls on the same df
+# don't share variables; the tool runs the agent's code on the sandbox pool
+def bind_pandas_agent(llm, df, extra_tools=()) -> AgentExecutor:
+    tools = [make_python_tool(df)] + list(extra_tools)
+    return AgentExecutor(
+        agent=_pandas_agent(llm, df, extra_tools),
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True,
+        max_iterations=15,
+        early_stopping_method='force',
+    )
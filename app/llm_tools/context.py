@@ -0,0 +1,57 @@
+from threading import Lock
+
+import pandas as pd
+
+
+MAX_CONTEXT_COLUMNS = 50 # wider frames only show their first columns in prompts
+MAX_CONTEXT_ROWS = 10
+MAX_CELL_WIDTH = 50 # long text cells are cut to this many characters
+
+
+class DataFrameContext:
+    """Text views of a dataframe (head, describe, dtypes) used to build prompts.
+
+    Each view is computed on first use and reused by every prompt of the report,
+    and is truncated to max_columns / max_rows so very wide data keeps prompts small.
+    """
+
+    def __init__(self, df: pd.DataFrame, max_columns=MAX_CONTEXT_COLUMNS, max_rows=MAX_CONTEXT_ROWS,
+                 max_cell_width=MAX_CELL_WIDTH):
+        self.df = df
+        self.max_columns = max_columns
+        self.max_rows = max_rows
+        self.max_cell_width = max_cell_width
+        self._views = {}
+        self._lock = Lock()
+
+    def _view(self, key, build):
+        with self._lock:
+            if key not in self._views:
+                self._views[key] = build()
+            return self._views[key]
+
+    @property
+    def shown(self) -> pd.DataFrame:
+        return self.df.iloc[:, :self.max_columns]
+
+    def _with_note(self, text: str) -> str:
+        hidden = len(self.df.columns) - self.max_columns
+        if hidden > 0:
+            text += f'\n... {hidden} more columns not shown'
+        return text
+
+    def head(self, n=5) -> str:
+        n = min(n, self.max_rows)
+        return self._view(('head', n), lambda: self._with_note(
+            self.shown.head(n).to_string(max_colwidth=self.max_cell_width)
+        ))
+
+    @property
+    def describe(self) -> str:
+        return self._view('describe', lambda: self._with_note(
+            self.shown.describe().to_string(max_colwidth=self.max_cell_width)
+        ))
+
+    @property
+    def dtypes(self) -> str:
+        return self._view('dtypes', lambda: self._with_note(self.shown.dtypes.to_string()))
@@ -0,0 +1,125 @@
+import pandas as pd
+
+from .context import MAX_CONTEXT_COLUMNS, MAX_CELL_WIDTH
+
+
+EXAMPLE_VALUES = 3 # distinct example values listed per column
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f'{value:,.4g}' if abs(value) < 1e6 else f'{value:,.0f}'
+    return str(value)
+
+
+def _cell(value) -> str:
+    text = _format(value).replace('|', '\\|').replace('\n', ' ')
+    return text if len(text) <= MAX_CELL_WIDTH else text[:MAX_CELL_WIDTH - 3] + '...'
+
+
+# Output: markdown table (markdown2's "tables" extra renders it)
+def _markdown_table(headers, rows) -> str:
+    lines = [
+        '| ' + ' | '.join(_cell(h) for h in headers) + ' |',
+        '|' + '---|' * len(headers),
+    ]
+    lines += ['| ' + ' | '.join(_cell(v) for v in row) + ' |' for row in rows]
+    return '\n'.join(lines)
+
+
+def _hidden_note(df: pd.DataFrame) -> str:
+    hidden = len(df.columns) - MAX_CONTEXT_COLUMNS
+    return f'\n\n_{hidden} more columns not shown._' if hidden > 0 else ''
+
+
+def _kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'date/time'
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return 'categorical'
+    return 'text'
+
+
+# "What are the columns in the dataframe? And what does each of them represent?"
+def columns_answer(df: pd.DataFrame) -> str:
+    rows = []
+    for col in df.columns[:MAX_CONTEXT_COLUMNS]:
+        series = df[col]
+        examples = series.dropna().drop_duplicates().head(EXAMPLE_VALUES)
+        rows.append((col, _kind(series), str(series.dtype), ', '.join(_format(v) for v in examples)))
+    return (
+        f'The dataframe has {len(df.columns)} columns:\n\n'
+        + _markdown_table(['Column', 'Kind', 'Type', 'Example values'], rows)
+        + _hidden_note(df)
+    )
+
+
+# "How many rows and columns are there, are there any missing values?"
+def shape_answer(df: pd.DataFrame) -> str:
+    missing = df.isna().sum()
+    total_missing = int(missing.sum())
+    answer = f'There are **{len(df):,} rows** and **{len(df.columns)} columns**.'
+    if df.attrs.get('truncated'):
+        answer += ' The file was longer; only these first rows were loaded.'
+    if total_missing == 0:
+        return answer + '\n\nThere are no missing values.'
+
+    missing = missing[missing > 0].sort_values(ascending=False)
+    rows = [(col, int(n), f'{n / len(df):.1%}') for col, n in missing.items()]
+    return (
+        f'{answer}\n\nThere are {total_missing:,} missing values in {len(missing)} columns:\n\n'
+        + _markdown_table(['Column', 'Missing', 'Share of rows'], rows[:MAX_CONTEXT_COLUMNS])
+    )
+
+
+# "What are some summary statistics about the data?"
+def statistics_answer(df: pd.DataFrame) -> str:
+    shown = df.iloc[:, :MAX_CONTEXT_COLUMNS]
+    sections = []
+
+    numeric = shown.select_dtypes(include='number')
+    if len(numeric.columns):
+        stats = numeric.describe().T
+        sections.append('**Numeric columns**\n\n' + _markdown_table(
+            ['Column', 'Count', 'Mean', 'Std', 'Min', 'Median', 'Max'],
+            [
+                (col, int(row['count']), row['mean'], row['std'], row['min'], row['50%'], row['max'])
+                for col, row in stats.iterrows()
+            ]
+        ))
+
+    dates = shown.select_dtypes(include='datetime')
+    if len(dates.columns):
+        sections.append('**Date columns**\n\n' + _markdown_table(
+            ['Column', 'Count', 'First', 'Last'],
+            [(col, int(dates[col].count()), dates[col].min(), dates[col].max()) for col in dates.columns]
+        ))
+
+    other = shown.select_dtypes(exclude=['number', 'datetime'])
+    if len(other.columns):
+        rows = []
+        for col in other.columns:
+            counts = other[col].value_counts()
+            counts = counts[counts > 0]
+            top = counts.index[0] if len(counts) else ''
+            rows.append((col, int(counts.sum()), len(counts), top, int(counts.iloc[0]) if len(counts) else 0))
+        sections.append('**Text and categorical columns**\n\n' + _markdown_table(
+            ['Column', 'Count', 'Distinct', 'Most frequent', 'Frequency'], rows
+        ))
+
+    if not sections:
+        return 'The dataframe has no columns to summarize.'
+    return '\n\n'.join(sections) + _hidden_note(df)
+
+
+# keys of questions.json that are answered from the dataframe directly, without an agent;
+# the rest (what the table represents) need the LLM's interpretation
+FAST_ANSWERS = {
+    '2': columns_answer,
+    '3': shape_answer,
+    '4': statistics_answer,
+}
@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+
+MAX_GRID_CELLS = 5_000_000 # scenario grid size accepted from the batch endpoint
+
+
+# Formulas of static/calculator.js (same keys and input ids), as numpy functions over arrays.
+# Rates are percentages like in the form; division by zero gives inf/nan instead of raising.
+
+def future_value(pv, rate, time):
+    return pv * (1 + rate / 100) ** time
+
+def present_value(fv, rate, time):
+    return fv / (1 + rate / 100) ** time
+
+def roi(current, initial):
+    return (current - initial) / initial * 100
+
+def cagr(final, initial, years):
+    return ((final / initial) ** (1 / years) - 1) * 100
+
+def compound_interest(principal, rate, time, frequency):
+    return principal * (1 + rate / 100 / frequency) ** (frequency * time)
+
+def current_ratio(assets, liabilities):
+    return assets / liabilities
+
+def loan_payment(principal, rate, months):
+    monthly = rate / 100 / 12
+    growth = (1 + monthly) ** months
+    # the page's formula is 0/0 at a 0% rate, its limit is an even split of the principal
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = principal * (monthly * growth) / (growth - 1)
+    return np.where(monthly == 0, principal / months, payment)
+
+def simple_interest(principal, rate, time):
+    return principal * rate / 100 * time
+
+def break_even(fixedCosts, price, variableCost):
+    return fixedCosts / (price - variableCost)
+
+def debt_to_equity(liabilities, equity):
+    return liabilities / equity
+
+def gross_margin(revenue, cogs):
+    return (revenue - cogs) / revenue * 100
+
+def npv(initial, cashflow, rate, years):
+    # closed form of the page's loop over t = 1..years (whole years only)
+    r = rate / 100
+    periods = np.floor(np.maximum(years, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = (1 - (1 + r) ** -periods) / r
+    return -initial + cashflow * np.where(r == 0, periods, annuity)
+
+def pe_ratio(price, eps):
+    return price / eps
+
+def dividend_yield(dividend, price):
+    return dividend / price * 100
+
+def asset_turnover(sales, assets):
+    return sales / assets
+
+def operating_margin(operatingIncome, revenue):
+    return operatingIncome / revenue * 100
+
+def quick_ratio(currentAssets, inventory, currentLiabilities):
+    return (currentAssets - inventory) / currentLiabilities
+
+
+# key -> (name, input ids in order, function, unit of the result)
+FORMULAS = {
+    'fv': ('Future Value', ('pv', 'rate', 'time'), future_value, 'currency'),
+    'pv': ('Present Value', ('fv', 'rate', 'time'), present_value, 'currency'),
+    'roi': ('Return on Investment', ('current', 'initial'), roi, 'percent'),
+    'cagr': ('Compound Annual Growth Rate', ('final', 'initial', 'years'), cagr, 'percent'),
+    'compound': ('Compound Interest', ('principal', 'rate', 'time', 'frequency'), compound_interest, 'currency'),
+    'ratio': ('Current Ratio', ('assets', 'liabilities'), current_ratio, 'ratio'),
+    'loan': ('Monthly Loan Payment', ('principal', 'rate', 'months'), loan_payment, 'currency'),
+    'simpleInterest': ('Simple Interest', ('principal', 'rate', 'time'), simple_interest, 'currency'),
+    'breakEven': ('Break-Even Point', ('fixedCosts', 'price', 'variableCost'), break_even, 'units'),
+    'debtEquity': ('Debt to Equity Ratio', ('liabilities', 'equity'), debt_to_equity, 'ratio'),
+    'grossMargin': ('Gross Profit Margin', ('revenue', 'cogs'), gross_margin, 'percent'),
+    'npv': ('Net Present Value', ('initial', 'cashflow', 'rate', 'years'), npv, 'currency'),
+    'peRatio': ('Price to Earnings Ratio', ('price', 'eps'), pe_ratio, 'ratio'),
+    'dividendYield': ('Dividend Yield', ('dividend', 'price'), dividend_yield, 'percent'),
+    'assetTurnover': ('Asset Turnover Ratio', ('sales', 'assets'), asset_turnover, 'ratio'),
+    'operatingMargin': ('Operating Margin', ('operatingIncome', 'revenue'), operating_margin, 'percent'),
+    'quickRatio': ('Quick Ratio', ('currentAssets', 'inventory', 'currentLiabilities'), quick_ratio, 'ratio'),
+}
+
+
+def _formula(key):
+    if key not in FORMULAS:
+        raise ValueError(f'Unknown formula {key!r}, expected one of: {", ".join(FORMULAS)}')
+    return FORMULAS[key]
+
+
+def _as_array(name, value) -> np.ndarray:
+    try:
+        return np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f'Input {name!r} must be numeric')
+
+
+# Input: formula key and its inputs as numbers or equal length (broadcastable) arrays
+# Output: float64 array of results
+def calculate(key, **inputs) -> np.ndarray:
+    _, names, func, _ = _formula(key)
+    missing = [name for name in names if name not in inputs]
+    if missing:
+        raise ValueError(f'Missing inputs for {key}: {", ".join(missing)}')
+    arrays = [_as_array(name, inputs[name]) for name in names]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        try:
+            return np.asarray(func(*arrays), dtype=np.float64)
+        except ValueError as e: # shapes that don't broadcast
+            raise ValueError(f'Inputs of {key} have mismatched lengths: {e}')
+
+
+# Output: {input: column name} of the inputs calculate_frame reads from columns
+def input_columns(key, columns=None, constants=None) -> dict:
+    _, names, _, _ = _formula(key)
+    columns = columns or {}
+    return {name: columns.get(name, name) for name in names if name not in (constants or {})}
+
+
+# Input: frame, formula key, {input: column name} (inputs default to the column of
+# the same name) and {input: number} for inputs that are the same on every row
+# Output: Series of results aligned with df; non-numeric cells give NaN
+def calculate_frame(df: pd.DataFrame, key, columns=None, constants=None) -> pd.Series:
+    inputs = dict(constants or {})
+    for name, col in input_columns(key, columns, constants).items():
+        if col not in df.columns:
+            raise ValueError(f'No column for input {name!r} of {key} (looked for {col!r})')
+        inputs[name] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    return pd.Series(calculate(key, **inputs), index=df.index, name=key)
+
+
+# Input: formula key, {input: list of values} spanning the grid and {input: number} for the rest
+# Output: (axis names, results array with one dimension per axis, in the order given)
+def calculate_grid(key, axes: dict, constants=None, max_cells=MAX_GRID_CELLS):
+    _, names, _, _ = _formula(key)
+    unknown = [name for name in list(axes) + list(constants or {}) if name not in names]
+    if unknown:
+        raise ValueError(f'{key} has no input {unknown[0]!r}, its inputs are: {", ".join(names)}')
+    values = [_as_array(name, axes[name]).ravel() for name in axes]
+    cells = int(np.prod([len(v) for v in values])) if values else 1
+    if cells > max_cells:
+        raise ValueError(f'The grid has {cells:,} cells, the limit is {max_cells:,}')
+    # sparse open grids broadcast to the full grid only in the result
+    grids = np.meshgrid(*values, indexing='ij', sparse=True) if values else []
+    inputs = dict(constants or {})
+    inputs.update(zip(axes, grids))
+    return list(axes), calculate(key, **inputs)
+
+
+# Output: long frame with one row per grid cell (axis columns + result column)
+def grid_frame(key, axes: dict, results: np.ndarray) -> pd.DataFrame:
+    names = list(axes)
+    index = pd.MultiIndex.from_product([np.asarray(axes[name], dtype=np.float64) for name in names], names=names)
+    return pd.DataFrame({key: results.ravel()}, index=index).reset_index()
+
+
+# Output: JSON-safe list (nested for grids), inf and nan become None
+def to_json_values(results: np.ndarray) -> list:
+    cleaned = np.where(np.isfinite(results), results, np.nan).astype(object)
+    cleaned[pd.isna(cleaned)] = None
+    return cleaned.tolist()
+
+
+# Output: count/mean/min/max and a few values of a result series, for the agents
+def describe_results(key, results: pd.Series, head=5) -> str:
+    name, _, _, unit = _formula(key)
+    finite = results[np.isfinite(results)]
+    lines = [f'{name} ({unit}) over {len(results)} rows, {len(results) - len(finite)} undefined (missing or division by zero)']
+    if len(finite):
+        lines.append(f'sum {finite.sum():.4f}, mean {finite.mean():.4f}, median {finite.median():.4f}, min {finite.min():.4f}, max {finite.max():.4f}')
+        lines.append('first rows: ' + ', '.join(f'{i}: {value:.4f}' for i, value in results.head(head).items()))
+    return '\n'.join(lines)
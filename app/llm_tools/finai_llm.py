@@ -1,66 +1,144 @@
-import re
-from pathlib import Path
+import time
 from math import floor
 import json
 import pandas as pd
-from textwrap import dedent
 
-from markdown2 import markdown
-from jinja2 import Template
-from ydata_profiling import ProfileReport
-from bs4 import BeautifulSoup
-
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentType, AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_experimental.agents.agent_toolkits import create_csv_agent
-from langchain_experimental.agents import create_pandas_dataframe_agent
+from langchain_core.callbacks import BaseCallbackHandler
 
-from io import StringIO
+from queue import Queue
+from threading import Lock, Event, Thread
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.datastructures import FileStorage
 
+from .profiler import profile_dataframe
+from .ingest import read_table
+from .formats import file_format
+from .context import DataFrameContext
+from .prompt_registry import read_prompt, render_prompt, load_json
+from .clients import get_chat_model, bind_pandas_agent, bind_tool_calling_agent
+from .calculator_tools import make_calculator_tools
 from .plotting_tools import make_plotting_tools#, scatter_plot, line_plot, bar_plot, stacked_bar_plot, make_inject_df
-
-
-your_api_key = "INSERT HERE YOUR OPENAI API KEY"
-
-
-
-# the path to the prompts dir
-PROMPT_DIR = Path(__file__).resolve().parent / 'prompts'
-
-def answer_finai(df, query):
-    with open(PROMPT_DIR / 'chatbot_prompt.jinja') as ctemp:
-        chat_template = ctemp.read()
-    prompt_template = Template(chat_template)
-    rendered_prompt = prompt_template.render(query=query)
-    
-    llm = ChatOpenAI(model="gpt-4o", 
-                     api_key=your_api_key)
-    agent = create_pandas_dataframe_agent(llm, 
-                                          df, 
-                                          verbose=True, 
-                                          handle_parsing_errors=True, 
-                                          allow_dangerous_code=True, 
-                                          agent_type=AgentType.OPENAI_FUNCTIONS)
-    return agent.run(rendered_prompt)
+from .chart_planner import plan_charts, run_chart_plan, NUM_CHARTS
+from .fast_answers import FAST_ANSWERS
+from .report_render import render_report, render_answer, create_plot_div
+from .metrics import Trace, span_config
+from .llm_scheduler import llm_context, propagate, backoff_delay, INTERACTIVE, BACKGROUND
+from .settings import your_api_key, DEFAULT_MODEL
+
+
+def get_chat_prompt(query):
+    return render_prompt('chatbot_prompt.jinja', query=query)
+
+def make_chat_agent(df, model=DEFAULT_MODEL, streaming=False):
+    # streamed responses only carry token usage when asked for it
+    settings = {'streaming': True, 'stream_usage': True} if streaming else {}
+    llm = get_chat_model(model, your_api_key, **settings)
+    return bind_pandas_agent(llm, df, make_calculator_tools(df))
+
+# user is who the LLM calls are queued for; chat calls go ahead of report generation
+def answer_finai(df, query, model=DEFAULT_MODEL, user=None):
+    trace = Trace('chat', model=model, streaming=False)
+    agent = make_chat_agent(df, model)
+    try:
+        with trace.stage('chat') as span, llm_context(user, INTERACTIVE):
+            answer = agent.run(get_chat_prompt(query), callbacks=span.callbacks)
+    except Exception:
+        trace.finish('error')
+        raise
+    trace.finish()
+    return answer
+
+
+class ChatCancelled(Exception):
+    pass
+
+# forwards agent steps and llm tokens to a queue, aborts the run once cancel_event is set
+class StreamingChatHandler(BaseCallbackHandler):
+    raise_error = True # let ChatCancelled stop the agent instead of being logged
+
+    def __init__(self, events: Queue, cancel_event: Event):
+        self.events = events
+        self.cancel_event = cancel_event
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ChatCancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._check_cancelled()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._check_cancelled()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._check_cancelled()
+        if token:
+            self.events.put({'type': 'token', 'text': token})
+
+    def on_agent_action(self, action, **kwargs):
+        self.events.put({'type': 'step', 'tool': action.tool, 'input': str(action.tool_input)})
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._check_cancelled()
+
+    def on_tool_end(self, output, **kwargs):
+        self.events.put({'type': 'observation', 'text': str(output)[:2000]})
+
+# Input: df, query and an optional Event that cancels the run when set
+# Output: generator of event dicts ('step', 'observation', 'token', then 'final', 'error' or 'cancelled')
+# closing the generator (e.g. the client disconnected) cancels the agent as well
+def stream_finai(df, query, model=DEFAULT_MODEL, cancel_event=None, user=None):
+    cancel_event = cancel_event or Event()
+    events = Queue()
+    handler = StreamingChatHandler(events, cancel_event)
+    agent = make_chat_agent(df, model, streaming=True)
+    trace = Trace('chat', model=model, streaming=True)
+
+    def run_agent():
+        status = 'ok'
+        try:
+            with trace.stage('chat') as span, llm_context(user, INTERACTIVE):
+                result = agent.invoke({'input': get_chat_prompt(query)}, config={'callbacks': [handler] + span.callbacks})
+            events.put({'type': 'final', 'text': result['output']})
+        except ChatCancelled:
+            status = 'cancelled'
+            events.put({'type': 'cancelled'})
+        except Exception as e:
+            if cancel_event.is_set():
+                status = 'cancelled'
+                events.put({'type': 'cancelled'})
+            else:
+                status = 'error'
+                events.put({'type': 'error', 'text': str(e)})
+        finally:
+            trace.finish(status)
+            events.put(None)
+
+    Thread(target=run_agent, daemon=True).start()
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+    finally:
+        cancel_event.set()
 
 MIN_QUESTIONS = 2
 MAX_QUESTIONS = 3
+MAX_WORKERS = 4 # concurrent csv agent calls per report, 1 runs everything sequentially
+PLOT_MODE = 'rules' # 'rules' picks charts from the profile, 'agent' asks the plotting agent
+PLOT_MODES = ('rules', 'agent')
+PLOT_AGENT_FALLBACK = False # let 'rules' fall back to the plotting agent when it draws fewer than 2 charts
 
-plot_data = list() # list of tuples
-
-def generate_questions(df, summary, llm, num_questions):
+def generate_questions(context: DataFrameContext, summary, llm, num_questions, span=None):
     # convert dict summary to formatted json string
     str_summary = str(summary)
-    head = df.head(10).to_string()
-    with open(PROMPT_DIR / 'gen_questions_user.jinja') as f:
-        template = f.read()
-    template = Template(template)
-    user_prompt = template.render(summary=str_summary, head=head, num_questions=num_questions)
-
-    with open(PROMPT_DIR / 'gen_questions_system.jinja') as f:
-        sys_prompt = f.read()
+    head = context.head(10)
+    user_prompt = render_prompt('gen_questions_user.jinja', summary=str_summary, head=head, num_questions=num_questions)
+    sys_prompt = read_prompt('gen_questions_system.jinja')
     
     messages = [
         (
@@ -72,35 +150,31 @@ def generate_questions(df, summary, llm, num_questions):
             user_prompt
         )
     ]
-    response = llm.invoke(messages)
+    response = llm.invoke(messages, config=span_config(span))
     question_dict = json.loads(response.content)
     question_list = list(question_dict.values())
     return question_list
 
-def get_agent_context(df: pd.DataFrame, question: str):
-    with open(PROMPT_DIR / 'question_context.jinja') as f:
-        template = f.read()
-    template = Template(template)
-    prompt = template.render(
-        head=df.head(5).to_string(),
-        describe=df.describe().to_string(),
-        dtypes=df.dtypes.to_string(),
+def get_agent_context(context: DataFrameContext, question: str):
+    prompt = render_prompt(
+        'question_context.jinja',
+        head=context.head(5),
+        describe=context.describe,
+        dtypes=context.dtypes,
         question=question
     )
     return prompt
 
-def get_plot_context(df: pd.DataFrame):
-    with open(PROMPT_DIR / 'plotting_context.jinja') as f:
-        template = f.read()
-    template = Template(template)
-    prompt = template.render(
-        head=df.head(5).to_string(),
-        describe=df.describe().to_string(),
-        dtypes=df.dtypes.to_string(),
+def get_plot_context(context: DataFrameContext):
+    prompt = render_prompt(
+        'plotting_context.jinja',
+        head=context.head(5),
+        describe=context.describe,
+        dtypes=context.dtypes,
     )
     return prompt
 
-# Input: json output of ydata profiler
+# Input: output of profile_dataframe (same layout as the ydata profiler json)
 # Output: cleaned up dict with less info and more descriptive names
 def get_initial_summary(data, df):
     data = data['variables']
@@ -131,180 +205,268 @@ def resolve_num_questions(n: int):
     return num_questions
 
 
-def create_plot_div(b64_image: str, description: str) -> str:
-    return dedent(f'''
-    <div class="plot-container">
-        <div class="plot">
-            <img class="plot-img" src="data:image/png;base64,{b64_image}"/>
-            <p class="plot-desc">{description}</p>
-        </div>
-    </div>
-    ''')
-    
-
-# Input: csv_path
-# Output: markdown formatted full report (str)
-def generate_report(csv_path, model='gpt-4o'):
-    # 0. setup
-    if isinstance(csv_path, FileStorage):
-        file_content = csv_path.read().decode('utf-8')
-        string_io = StringIO()
-        string_io.write(file_content)
-        string_io.seek(0)
-        csv_path = string_io
-
-    llm = ChatOpenAI(model=model, api_key=your_api_key)
-    csv_agent = create_csv_agent(
-        llm, 
-        csv_path,
-        verbose=True,
-        handle_parsing_errors=True,
-        allow_dangerous_code=True,
-        agent_type=AgentType.OPENAI_FUNCTIONS,
-    )
-
-    # 1. bulid df and graphing agent
-    if isinstance(csv_path, StringIO):
-        csv_path.seek(0)
-    df = pd.read_csv(csv_path)
-    print(df.head())
-    num_questions = resolve_num_questions(len(df))
-
-    tools = make_plotting_tools(df)
-
-    prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a data visualization assistant. Given an analysis question and views of a dataframe, create the most relevant chart using the tools provided."),
-            ("user", "{input}"),
-            MessagesPlaceholder("agent_scratchpad")
-        ], 
-    )
-    plotting_agent_base = create_tool_calling_agent(llm, tools, prompt)
-    plotting_agent = AgentExecutor(agent=plotting_agent_base, tools=tools, verbose=True)
-
-    # 2. run through combinator to extract structured insights
-    profile = ProfileReport(df)
-    dict_summary = profile.to_json()
-    dict_summary = json.loads(dict_summary)
-    ydata_html = profile.to_html() # keep this for later injection for the dynamic viewer
-
-
-    ### 2A. generate clean summary from dict_summary
-    initial_summary = get_initial_summary(dict_summary, df)
-
-    # 3. generate pertinent questions about the data
-    questions = generate_questions(df, initial_summary, llm, num_questions)
-
-    # 4. invoke csv agent for each of these questions
-    question_report_str = ""
-    question_report_str_img = ""
-    missed = 0
-    for i, question in enumerate(questions, start=1):
-        # answer question
-        question_prompt = get_agent_context(df, question)
+# Input: a question about context.df
+# Output: the agent's answer (str), None if the question was skipped
+def answer_question(llm, context: DataFrameContext, question, i, trace: Trace):
+    # every question gets its own python tool so concurrent calls don't share locals
+    csv_agent = bind_pandas_agent(llm, context.df, make_calculator_tools(context.df))
+    question_prompt = get_agent_context(context, question)
+    with trace.stage('qa', label=question) as span:
         try:
-            result = csv_agent.invoke(question_prompt)
-            
+            result = csv_agent.invoke(question_prompt, config=span_config(span))
         except Exception as e:
             try:
                 print(f'Retrying question {i}. Error: {e}')
-                result = csv_agent.invoke(question_prompt)
+                span.retry()
+                time.sleep(backoff_delay(1))
+                result = csv_agent.invoke(question_prompt, config=span_config(span))
             except Exception as e2:
                 print(f'Skipped question {i}. Error: {e2}')
-                missed += 1
-                continue        
-        
-
-        content = list(result.values())[-1]
-        
-        question_report_str += f'\n### Question {i-missed}: {question}\n{content}'
-        #question_report_str_img += f'\n### Question {i-missed}: {question}\n{content}\n{img_div}'
-    
-    # 5. Ask the *primary* fixed questions from the data
-    with open(PROMPT_DIR / 'questions.json') as f:
-        questions_dict = json.load(f)
-    primary_questions = list(questions_dict.values())
-    primary_report_str = ""
+                span.error = f'skipped: {e2}'
+                return None
+    return list(result.values())[-1]
+
+def fast_answer(key, df, trace: Trace):
+    with trace.stage('fast_answer', label=key):
+        return FAST_ANSWERS[key](df)
+
+# Input: questions and their answers in the same order
+# Output: markdown q-a section, skipped questions are left out of the numbering
+def format_answers(questions, answers, suffix=''):
+    report_str = ""
     missed = 0
-    for i, question in enumerate(primary_questions, start=1):
-        # answer question
-        question_prompt = get_agent_context(df, question)
-        try:
-            result = csv_agent.invoke(question_prompt)
-        except Exception as e:
-            try:
-                print(f'Retrying question {i}. Error: {e}')
-                result = csv_agent.invoke(question_prompt)
-            except Exception as e2:
-                print(f'Skipped question {i}. Error: {e2}')
-                missed += 1
-                continue
-        content = list(result.values())[-1]
-        primary_report_str += f'\n### Question {i-missed}: {question}\n{content}\n'
-
-    # 6. Join both question-answer reports
-    context_qa = f'\n## Primary questions\n{primary_report_str}\n\n## Secondary exploratory questions\n{question_report_str}'
-
-    # 7. Invoke LLM to generate executive summary based on all q-a pairs and other views
-    ### Build the summary 
-    with open(PROMPT_DIR / 'executive_prompt_system.jinja') as f:
-        sys_prompt = f.read()
-    with open(PROMPT_DIR / 'executive_prompt_user.jinja') as f:
-        user_prompt = f.read()
-    
-    head = df.head().to_string()
-
-    user_prompt = Template(user_prompt).render(
-        head=head,
-        summary=str(initial_summary),
-        report=context_qa
-    )
-    
-    messages = [
-        ('system', sys_prompt),
-        ('user', user_prompt)
-    ]
-    executive_summary = llm.invoke(messages).content
-
-    # generate plots
-    
-    retries = 3
+    for i, (question, content) in enumerate(zip(questions, answers), start=1):
+        if content is None:
+            missed += 1
+            continue
+        report_str += f'\n### Question {i-missed}: {question}\n{content}{suffix}'
+    return report_str
+
+def run_plotting_agent(plotting_agent, context: DataFrameContext, plot_sink, retries=3, span=None):
     for attempt in range(retries):
+        if attempt and span is not None:
+            span.retry()
         try:
-            plot_result = plotting_agent.invoke({
-                'input': get_plot_context(df)
-            })
-            if len(plot_data) < 2:
+            plotting_agent.invoke({
+                'input': get_plot_context(context)
+            }, config=span_config(span))
+            if len(plot_sink) < 2:
                 continue
             break  # successful
         except Exception as e:
-            #plot_data.clear()
+            #plot_sink.clear()
             print(f"Plotting_agent: attempt {attempt + 1} failed: {e}")
             # if attempt == retries - 1:
             #     raise # raise if all tries fail
 
-    # 8. Merge and convert report
-    full_report = f'{executive_summary}\n\n{create_plot_div(*plot_data.pop())}'
-    full_report = re.sub(
-        r'^(?=## Insights)',  # lookahead for "## Insights"
-        f'{create_plot_div(*plot_data.pop())}\n',
-        full_report,
-        flags=re.MULTILINE    # so that ^ matches start of lines
-    )
-    full_report = f'\n{full_report}'
-
-    full_report = markdown(full_report, extras=["tables"], safe_mode=False)
+# Input: profile_dataframe output, or None when plot_mode is 'agent'
+# 'rules' draws the charts picked by the chart planner; with agent_fallback the
+# plotting agent is asked for whatever the planner couldn't draw
+def draw_charts(plot_mode, agent_fallback, plotting_agent, context: DataFrameContext, tools, plot_sink, trace: Trace, profile=None):
+    with trace.stage('plots', label=plot_mode) as span:
+        if plot_mode == 'rules':
+            drawn = run_chart_plan(plan_charts(context.df, profile), tools, plot_sink)
+            if drawn >= NUM_CHARTS or not agent_fallback:
+                return
+        run_plotting_agent(plotting_agent, context, plot_sink, span=span)
+
+PLOTTING_PROMPT = ChatPromptTemplate.from_messages([
+        ("system", "You are a data visualization assistant. Given an analysis question and views of a dataframe, create the most relevant chart using the tools provided."),
+        ("user", "{input}"),
+        MessagesPlaceholder("agent_scratchpad")
+    ], 
+)
+
+def _no_progress(stage, done=None, total=None):
+    pass
+
+# plot_sink that reports every chart as soon as a tool appends it
+class ChartSink(list):
+    def __init__(self, on_chart):
+        super().__init__()
+        self.on_chart = on_chart
+
+    def append(self, chart):
+        super().append(chart)
+        self.on_chart(chart)
+
+# Input: csv_path (path, stream or FileStorage of a csv, parquet, arrow or excel file;
+# streams are read as csv) or an already ingested DataFrame
+# Output: report html (str)
+# max_workers > 1 answers the questions concurrently (answers keep their order)
+# and draws the charts alongside the q-a and summary steps.
+# plot_mode 'rules' picks charts from the column profile without the LLM, 'agent' uses
+# the plotting agent; agent_fallback lets 'rules' ask the agent when it drew fewer than 2.
+# progress(stage, done=None, total=None) is called as the report moves through
+# 'profiling', 'questions', 'qa' (done/total answered), 'summary', 'plots' and 'rendering'
+# on_section({'kind': 'answer' or 'chart', 'html': ...}) receives every answered question
+# and drawn chart as soon as it is ready, from the thread that produced it.
+# Stage timings and token usage go to trace; without one the report records its own.
+# The report's LLM calls are queued for user at background priority.
+def generate_report(csv_path, model=DEFAULT_MODEL, max_workers=MAX_WORKERS, progress=None,
+                    plot_mode=PLOT_MODE, agent_fallback=PLOT_AGENT_FALLBACK, trace=None, user=None,
+                    on_section=None):
+    if plot_mode not in PLOT_MODES:
+        raise ValueError(f'Unknown plot_mode {plot_mode!r}, expected one of: {", ".join(PLOT_MODES)}')
+    args = (csv_path, model, max_workers, progress, plot_mode, agent_fallback, on_section)
+    with llm_context(user, BACKGROUND):
+        if trace is not None:
+            return _generate_report(*args, trace)
+        trace = Trace('report', model=model)
+        try:
+            report = _generate_report(*args, trace)
+        except Exception:
+            trace.finish('failed')
+            raise
+        trace.finish()
+        return report
 
-    # 9. Add classes to headers
-    soup = BeautifulSoup(full_report)
+def _generate_report(csv_path, model, max_workers, progress, plot_mode, agent_fallback, on_section, trace: Trace):
+    report_progress = progress or _no_progress
 
-    for h2 in soup.find_all('h2', string=re.compile(r'.*Insight.*', re.IGNORECASE)):
-        h2['class'] = ['insights']
+    def emit(kind, html):
+        if on_section is not None:
+            on_section({'kind': kind, 'html': html})
 
-    for h2 in soup.find_all('h2', string=re.compile(r'.*overview.*', re.IGNORECASE)):
-        h2['class'] = ['overview']
-        
-    plot_data.clear()
-    full_report = soup.prettify()
-    return full_report
+    # 0. setup
+    llm = get_chat_model(model, your_api_key)
 
+    # 1. bulid df and graphing agent
+    # the file is parsed once here and this df is shared by every agent and tool below
+    if isinstance(csv_path, pd.DataFrame):
+        df = csv_path
+    else:
+        with trace.stage('ingest'):
+            if isinstance(csv_path, FileStorage):
+                df = read_table(csv_path.stream, file_format(csv_path.filename))
+            else:
+                df = read_table(csv_path)
+    print(df.head())
+    num_questions = resolve_num_questions(len(df))
+    # head/describe/dtypes views shared by every prompt of this report
+    context = DataFrameContext(df)
+
+    # charts of this report only, so concurrent reports can't pick up each other's plots
+    plot_sink = ChartSink(lambda chart: emit('chart', create_plot_div(*chart))) # list of tuples
+    tools = make_plotting_tools(df, plot_sink)
+
+    plotting_agent = bind_tool_calling_agent(llm, PLOTTING_PROMPT, tools)
+
+    concurrent = max_workers > 1
+    qa_pool = ThreadPoolExecutor(max_workers=max_workers)
+    plot_pool = ThreadPoolExecutor(max_workers=1)
+
+    qa_lock = Lock()
+    qa_count = {'done': 0, 'total': 0}
+
+    def answer_done(question, future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            emit('answer', render_answer(question, future.result()))
+
+    def question_done(question, future):
+        with qa_lock:
+            qa_count['done'] += 1
+            report_progress('qa', qa_count['done'], qa_count['total'])
+        answer_done(question, future)
+
+    def submit_questions(questions):
+        with qa_lock:
+            qa_count['total'] += len(questions)
+        futures = [
+            qa_pool.submit(propagate(answer_question), llm, context, question, i, trace)
+            for i, question in enumerate(questions, start=1)
+        ]
+        for question, future in zip(questions, futures):
+            future.add_done_callback(partial(question_done, question))
+        return futures
+
+    # primary questions with a FAST_ANSWERS entry are computed from df directly,
+    # only the interpretive ones go through an agent
+    def submit_primary(questions_dict):
+        llm_questions = [q for key, q in questions_dict.items() if key not in FAST_ANSWERS]
+        llm_futures = iter(submit_questions(llm_questions))
+        futures = []
+        for key, question in questions_dict.items():
+            if key not in FAST_ANSWERS:
+                futures.append(next(llm_futures))
+                continue
+            future = qa_pool.submit(fast_answer, key, df, trace)
+            future.add_done_callback(partial(answer_done, question))
+            futures.append(future)
+        return futures
+
+    try:
+        # the agent's plots only depend on df, so they can be drawn while the questions are answered
+        if concurrent and plot_mode == 'agent':
+            plot_future = plot_pool.submit(propagate(draw_charts), plot_mode, agent_fallback, plotting_agent, context, tools, plot_sink, trace)
+
+        # the primary fixed questions don't depend on the profile either
+        questions_dict = load_json('questions.json')
+        primary_questions = list(questions_dict.values())
+        if concurrent:
+            primary_futures = submit_primary(questions_dict)
+
+        # 2. run through combinator to extract structured insights
+        report_progress('profiling')
+        with trace.stage('profile'):
+            dict_summary = profile_dataframe(df)
+            # planned charts need the profile, and are drawn while the questions are answered
+            if concurrent and plot_mode == 'rules':
+                plot_future = plot_pool.submit(propagate(draw_charts), plot_mode, agent_fallback, plotting_agent, context, tools, plot_sink, trace, dict_summary)
+
+            ### 2A. generate clean summary from dict_summary
+            initial_summary = get_initial_summary(dict_summary, df)
+
+        # 3. generate pertinent questions about the data
+        report_progress('questions')
+        with trace.stage('questions') as span:
+            questions = generate_questions(context, initial_summary, llm, num_questions, span)
+
+        # 4. invoke csv agent for each of these questions
+        question_answers = [future.result() for future in submit_questions(questions)]
+        question_report_str = format_answers(questions, question_answers)
+
+        # 5. Ask the *primary* fixed questions from the data
+        if not concurrent:
+            primary_futures = submit_primary(questions_dict)
+        primary_answers = [future.result() for future in primary_futures]
+        primary_report_str = format_answers(primary_questions, primary_answers, suffix='\n')
+
+        # 6. Join both question-answer reports
+        context_qa = f'\n## Primary questions\n{primary_report_str}\n\n## Secondary exploratory questions\n{question_report_str}'
+
+        # 7. Invoke LLM to generate executive summary based on all q-a pairs and other views
+        ### Build the summary 
+        report_progress('summary')
+        with trace.stage('summary') as span:
+            sys_prompt = read_prompt('executive_prompt_system.jinja')
+
+            head = context.head(5)
+
+            user_prompt = render_prompt(
+                'executive_prompt_user.jinja',
+                head=head,
+                summary=str(initial_summary),
+                report=context_qa
+            )
+
+            messages = [
+                ('system', sys_prompt),
+                ('user', user_prompt)
+            ]
+            executive_summary = llm.invoke(messages, config=span_config(span)).content
+
+        # generate plots
+        report_progress('plots')
+        if concurrent:
+            plot_future.result()
+        else:
+            draw_charts(plot_mode, agent_fallback, plotting_agent, context, tools, plot_sink, trace, dict_summary)
+    finally:
+        qa_pool.shutdown(wait=False, cancel_futures=True)
+        plot_pool.shutdown(wait=False, cancel_futures=True)
 
+    # 8. Merge and convert report
+    report_progress('rendering')
+    with trace.stage('render'):
+        return render_report(executive_summary, plot_sink)
@@ -0,0 +1,25 @@
+import os
+
+
+# upload extension -> reader in ingest.read_table; kept apart from ingest so the
+# routes can check file names without importing pandas
+UPLOAD_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'arrow',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+    '.xlsx': 'excel',
+    '.xlsm': 'excel',
+    '.xls': 'excel',
+}
+UPLOAD_ACCEPT = ','.join(UPLOAD_FORMATS) # for <input type="file" accept=...>
+UPLOAD_HINT = 'Please upload a CSV, Parquet, Feather/Arrow or Excel file.'
+
+
+# Output: reader name for a file name or path ('csv', 'parquet', 'arrow', 'excel'), None if unsupported
+def file_format(filename):
+    if not filename:
+        return None
+    return UPLOAD_FORMATS.get(os.path.splitext(str(filename))[1].lower())
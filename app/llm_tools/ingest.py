@@ -0,0 +1,283 @@
+import os
+import hashlib
+import tempfile
+import warnings
+
+import pandas as pd
+
+from .formats import file_format
+
+
+CHUNK_ROWS = 100_000 # rows parsed per chunk
+MAX_ROWS = 5_000_000 # rows kept from an upload, None keeps everything
+MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+CATEGORY_MAX_RATIO = 0.5 # text columns with fewer distinct values than this share of rows become categoricals
+DATE_MIN_PARSED = 0.95 # share of a text column that must parse as dates to convert it
+DATE_SAMPLE = 200 # values tried before parsing a whole column as dates
+DATE_YEARS = (1900, 2100) # parsed dates outside these years mean the column wasn't dates
+COPY_BLOCK = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class HashingReader:
+    """File-like wrapper that hashes and counts bytes as they are read,
+    so an upload is parsed and fingerprinted in the same pass."""
+
+    def __init__(self, stream, max_bytes=MAX_UPLOAD_BYTES):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def read(self, n=-1):
+        data = self.stream.read(n)
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(f'File is larger than {self.max_bytes // (1024 * 1024)}MB.')
+        self._hash.update(data)
+        return data
+
+    def __iter__(self):
+        # pandas only needs read(), but some code paths check for iteration support
+        return iter(lambda: self.read(COPY_BLOCK), b'')
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+# Input: uploaded FileStorage (or any binary stream)
+# Output: (path of a temporary copy, sha256 of its content), the caller deletes the file.
+# The copy keeps the upload's extension, so read_table(path) knows its format.
+def spool_upload(file, max_bytes=MAX_UPLOAD_BYTES):
+    reader = HashingReader(getattr(file, 'stream', file), max_bytes)
+    suffix = os.path.splitext(getattr(file, 'filename', None) or '')[1].lower() or '.csv'
+    fd, path = tempfile.mkstemp(prefix='finai-upload-', suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for block in reader:
+                out.write(block)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, reader.hexdigest()
+
+
+def _downcast_integers(chunk: pd.DataFrame) -> pd.DataFrame:
+    # floats stay 64 bit so monetary values keep their precision
+    for col in chunk.select_dtypes(include='integer').columns:
+        chunk[col] = pd.to_numeric(chunk[col], downcast='integer')
+    return chunk
+
+
+def _is_text(series: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+# Output: strftime format of the column's dates, None unless the values carry an explicit
+# year and month. Month labels ('Jan', 'May 1') and bare years ('2020') are left as text;
+# pd.to_datetime would read them as year 1 or as January 1st.
+def _date_format(sample: pd.Series):
+    from pandas.tseries.api import guess_datetime_format
+
+    value = str(sample.iloc[0]).strip()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        fmt = guess_datetime_format(value) or guess_datetime_format(value, dayfirst=True)
+    if fmt is None or '%Y' not in fmt or not any(month in fmt for month in ('%m', '%b', '%B')):
+        return None
+    # ISO dates often mix in times and offsets further down the column
+    return 'ISO8601' if fmt.startswith('%Y-%m-%d') else fmt
+
+
+def _parse_dates(series: pd.Series, fmt) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            dates = pd.to_datetime(series, format=fmt, errors='coerce')
+        except (TypeError, ValueError, OverflowError):
+            return pd.Series(pd.NaT, index=series.index)
+    years = dates.dt.year
+    if years.min() < DATE_YEARS[0] or years.max() > DATE_YEARS[1]:
+        return pd.Series(pd.NaT, index=series.index)
+    return dates
+
+
+# Input: concatenated chunks and the columns that were text in some chunks and not in others
+# Each chunk infers its own dtypes, so a column with numbers in the first chunks and text
+# in a later one concatenates to an object column mixing ints and strings; it becomes text throughout.
+def _unify_chunk_dtypes(df: pd.DataFrame, mixed_columns) -> pd.DataFrame:
+    for col in mixed_columns:
+        series = df[col]
+        df[col] = series.where(series.isna(), series.astype(str))
+    return df
+
+
+def narrow_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.columns:
+        series = df[col]
+        if not _is_text(series) or isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        count = series.notna().sum()
+        if count == 0:
+            continue
+
+        # a small sample rules out most non-date columns before the full (slower) parse
+        sample = series.dropna().head(DATE_SAMPLE)
+        fmt = _date_format(sample)
+        if fmt is not None and _parse_dates(sample, fmt).notna().mean() >= DATE_MIN_PARSED:
+            dates = _parse_dates(series, fmt)
+            if dates.notna().sum() >= DATE_MIN_PARSED * count:
+                df[col] = dates
+                continue
+
+        if series.nunique() <= CATEGORY_MAX_RATIO * count:
+            df[col] = series.astype('category')
+    return df
+
+
+# Input: path or binary/text stream with csv content
+# Output: DataFrame parsed chunk by chunk with narrowed dtypes;
+# df.attrs['truncated'] is True when max_rows cut the file short
+# columns limits parsing to those columns
+def read_csv(source, max_rows=MAX_ROWS, chunksize=CHUNK_ROWS, narrow=True, columns=None) -> pd.DataFrame:
+    chunks = []
+    text_columns, other_columns = set(), set()
+    rows = 0
+    truncated = False
+    with pd.read_csv(source, chunksize=chunksize, low_memory=False, usecols=columns) as reader:
+        for chunk in reader:
+            for col in chunk.columns:
+                # an all-empty chunk column is float, that doesn't make the column mixed
+                if chunk[col].notna().any():
+                    (text_columns if _is_text(chunk[col]) else other_columns).add(col)
+            if max_rows is not None and rows + len(chunk) > max_rows:
+                chunk = chunk.iloc[:max_rows - rows]
+                truncated = True
+            chunks.append(_downcast_integers(chunk) if narrow else chunk)
+            rows += len(chunk)
+            if truncated:
+                break
+
+    if len(chunks) > 1:
+        df = _unify_chunk_dtypes(pd.concat(chunks, ignore_index=True), text_columns & other_columns)
+    else:
+        df = chunks[0]
+    del chunks
+    if narrow:
+        df = narrow_dtypes(df)
+    df.attrs['truncated'] = truncated
+    return df
+
+
+def _arrow_frame(table, max_rows, narrow) -> pd.DataFrame:
+    truncated = max_rows is not None and table.num_rows > max_rows
+    if truncated:
+        table = table.slice(0, max_rows)
+    # Arrow backed dtypes wrap the table's buffers instead of converting them to numpy
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    if narrow:
+        df = narrow_dtypes(df)
+    df.attrs['truncated'] = truncated
+    return df
+
+
+# Input: path or binary file with Parquet content
+# Output: DataFrame with Arrow backed dtypes and narrowed text columns; only columns are
+# read when given, and row groups past max_rows are never decoded
+def read_parquet(source, max_rows=MAX_ROWS, columns=None, narrow=True) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(source)
+    batches = []
+    rows = 0
+    for batch in parquet.iter_batches(batch_size=CHUNK_ROWS, columns=columns):
+        batches.append(batch)
+        rows += batch.num_rows
+        if max_rows is not None and rows > max_rows:
+            break
+    if batches:
+        table = pa.Table.from_batches(batches)
+    else:
+        table = parquet.schema_arrow.empty_table()
+        table = table if columns is None else table.select(columns)
+    return _arrow_frame(table, max_rows, narrow)
+
+
+# Input: path or binary file in the Arrow IPC file format (Feather v2) or stream format
+# Output: DataFrame with Arrow backed dtypes and narrowed text columns, limited to columns when given
+def read_arrow(source, max_rows=MAX_ROWS, columns=None, narrow=True) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    try:
+        table = feather.read_table(source, columns=columns, memory_map=False)
+    except pa.ArrowInvalid:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        table = pa.ipc.open_stream(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return _arrow_frame(table, max_rows, narrow)
+
+
+# Input: path or binary file with an Excel workbook, the first sheet is read
+# Output: DataFrame with Arrow backed dtypes and narrowed text columns
+def read_excel(source, max_rows=MAX_ROWS, columns=None, narrow=True) -> pd.DataFrame:
+    df = pd.read_excel(source, usecols=columns, nrows=None if max_rows is None else max_rows + 1,
+                       dtype_backend='pyarrow')
+    truncated = max_rows is not None and len(df) > max_rows
+    if truncated:
+        df = df.iloc[:max_rows]
+    if narrow:
+        df = narrow_dtypes(df)
+    df.attrs['truncated'] = truncated
+    return df
+
+
+# Input: path or binary file, its format ('csv', 'parquet', 'arrow' or 'excel', taken
+# from the path's extension when None) and optionally the only columns to load
+# Output: DataFrame for the agents and tools; df.attrs['truncated'] as in read_csv
+def read_table(source, fmt=None, max_rows=MAX_ROWS, columns=None, narrow=True) -> pd.DataFrame:
+    fmt = fmt or file_format(source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', None)) or 'csv'
+    if fmt == 'parquet':
+        return read_parquet(source, max_rows, columns, narrow)
+    if fmt == 'arrow':
+        return read_arrow(source, max_rows, columns, narrow)
+    if fmt == 'excel':
+        return read_excel(source, max_rows, columns, narrow)
+    return read_csv(source, max_rows, narrow=narrow, columns=columns)
+
+
+# Output: column names of a stored table, read from the file's metadata where the format has it
+def read_columns(source, fmt=None) -> list:
+    fmt = fmt or file_format(source) or 'csv'
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(source).schema_arrow.names
+    if fmt == 'arrow':
+        import pyarrow as pa
+        return pa.ipc.open_file(source).schema.names
+    return list(read_table(source, fmt, max_rows=0, narrow=False).columns)
+
+
+# Input: uploaded FileStorage
+# Output: (DataFrame, sha256 of the file). CSV is parsed in a single pass over the upload
+# stream; the columnar and Excel formats need random access, so they are spooled first.
+def read_upload(file, max_bytes=MAX_UPLOAD_BYTES, **read_kwargs):
+    fmt = file_format(file.filename) or 'csv'
+    if fmt != 'csv':
+        path, file_hash = spool_upload(file, max_bytes)
+        try:
+            return read_table(path, fmt, **read_kwargs), file_hash
+        finally:
+            os.unlink(path)
+    reader = HashingReader(file.stream, max_bytes)
+    df = read_csv(reader, **read_kwargs)
+    # drain whatever pandas didn't need (e.g. after max_rows) so the hash covers the whole file
+    for _ in reader:
+        pass
+    return df, reader.hexdigest()
@@ -0,0 +1,165 @@
+import time
+import heapq
+import random
+import itertools
+from threading import Condition
+from functools import partial
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from .metrics import LLM_QUEUE_SECONDS
+
+
+# account limits of the OpenAI key, calls wait in the queue instead of getting 429s
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 300_000
+MAX_ATTEMPTS = 5 # per LLM call, including the first one
+BASE_BACKOFF = 1.0 # seconds, doubled on every retry
+MAX_BACKOFF = 60.0
+COMPLETION_TOKENS_ESTIMATE = 500 # reserved per call until the real usage is known
+CHARS_PER_TOKEN = 4
+
+INTERACTIVE = 0 # /chat, a user is waiting on the answer
+BACKGROUND = 1 # report generation
+
+_user = ContextVar('llm_user', default=None)
+_priority = ContextVar('llm_priority', default=BACKGROUND)
+
+
+# Sets who LLM calls made in this block are for; nested blocks override outer ones
+@contextmanager
+def llm_context(user=None, priority=BACKGROUND):
+    user_token = _user.set(user)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _user.reset(user_token)
+        _priority.reset(priority_token)
+
+
+# Output: fn bound to a copy of the current context, for pool threads (which don't inherit it)
+def propagate(fn):
+    return partial(copy_context().run, fn)
+
+
+def backoff_delay(attempt, retry_after=None) -> float:
+    # full jitter keeps retries from many threads from lining up again
+    delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Output: seconds until amount is available (0 when it is)
+    def wait_time(self, amount, now) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity) # oversized calls wait for a full bucket, not forever
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount # may go negative when a call used more than reserved
+
+
+class LLMScheduler:
+    """Admits LLM calls under request and token per minute budgets.
+
+    Waiting calls are served interactive before background, and within a priority
+    fairly across users (start-time fair queueing: a user with many queued calls
+    doesn't delay another user's first one). A 429 pauses every call until its
+    Retry-After has passed.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._cond = Condition()
+        self._queue = [] # (priority, virtual start, seq)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._user_finish = {} # user -> virtual finish of their last queued call
+        self._paused_until = 0.0
+
+    def _enqueue(self, user, priority):
+        start = max(self._virtual_time, self._user_finish.get((priority, user), 0.0))
+        self._user_finish[(priority, user)] = start + 1
+        ticket = (priority, start, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    # blocks until the call may be sent; tokens are the estimated prompt + completion size
+    def acquire(self, tokens, user=None, priority=None):
+        user = _user.get() if user is None else user
+        priority = _priority.get() if priority is None else priority
+        queued = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(user, priority)
+            while True:
+                if self._queue[0] == ticket:
+                    now = time.monotonic()
+                    wait = max(
+                        self._paused_until - now,
+                        self.requests.wait_time(1, now),
+                        self.tokens.wait_time(tokens, now),
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self._queue)
+                        self._virtual_time = ticket[1]
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        if len(self._user_finish) > 10_000:
+                            self._user_finish = {k: v for k, v in self._user_finish.items() if v > self._virtual_time}
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+        LLM_QUEUE_SECONDS.observe(time.monotonic() - queued, priority='interactive' if priority == INTERACTIVE else 'background')
+
+    # new budgets for this process, e.g. its share of the account limits when several processes use the key
+    def set_limits(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        with self._cond:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+            self._cond.notify_all()
+
+    # corrects the token bucket once the real usage of a call is known
+    def settle(self, reserved, used):
+        with self._cond:
+            self.tokens.take(used - reserved)
+
+    # rate limited by the API: hold every call for retry_after seconds
+    def pause(self, retry_after):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+
+scheduler = LLMScheduler()
+
+
+def estimate_tokens(messages, max_tokens=None) -> int:
+    chars = sum(len(str(message.content)) for message in messages)
+    return chars // CHARS_PER_TOKEN + (max_tokens or COMPLETION_TOKENS_ESTIMATE)
+
+
+# Output: seconds from the Retry-After (or retry-after-ms) header of an API error, None without one
+def retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if 'retry-after-ms' in headers:
+            return float(headers['retry-after-ms']) / 1000
+        if 'retry-after' in headers:
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import uuid
+from pathlib import Path
+from threading import Lock
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# one JSON file per report/chat is written here when set (e.g. FINAI_TRACE_DIR=instance/traces)
+TRACE_DIR = os.environ.get('FINAI_TRACE_DIR')
+
+# USD per 1M (prompt, completion) tokens, used for the cost estimates
+MODEL_COSTS = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _cost(model, prompt_tokens, completion_tokens) -> float:
+    # dated snapshots (gpt-4o-2024-08-06) are priced like their base model
+    prices = MODEL_COSTS.get(model)
+    if prices is None:
+        base = max((name for name in MODEL_COSTS if model.startswith(name)), key=len, default=None)
+        prices = MODEL_COSTS.get(base, (0.0, 0.0))
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, doc):
+        self.name = name
+        self.doc = doc
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def exposition(self) -> list:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        with self._lock:
+            lines += [f'{self.name}{_label_text(key)} {value}' for key, value in self._values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._values = {} # labels -> [bucket counts..., count, sum]
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    def exposition(self) -> list:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, row in self._values.items():
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f'{self.name}_bucket{_label_text(key + (("le", bound),))} {count}')
+                lines.append(f'{self.name}_bucket{_label_text(key + (("le", "+Inf"),))} {row[-2]}')
+                lines.append(f'{self.name}_count{_label_text(key)} {row[-2]}')
+                lines.append(f'{self.name}_sum{_label_text(key)} {row[-1]}')
+        return lines
+
+
+RUNS = Counter('finai_runs_total', 'Reports and chat calls by outcome.')
+RUN_SECONDS = Histogram('finai_run_seconds', 'End to end duration of reports and chat calls.')
+STAGE_SECONDS = Histogram('finai_stage_seconds', 'Duration of each pipeline stage.')
+STAGE_RETRIES = Counter('finai_stage_retries_total', 'Retried attempts per pipeline stage.')
+LLM_CALLS = Counter('finai_llm_calls_total', 'Completed LLM calls.')
+LLM_TOKENS = Counter('finai_llm_tokens_total', 'LLM tokens used, by type (prompt or completion).')
+LLM_COST = Counter('finai_llm_cost_usd_total', 'Estimated LLM spend in USD.')
+LLM_QUEUE_SECONDS = Histogram('finai_llm_queue_seconds', 'Time LLM calls waited in the scheduler, by priority.')
+LLM_BACKOFFS = Counter('finai_llm_backoffs_total', 'LLM calls retried after an API error, by reason.')
+
+_METRICS = [RUNS, RUN_SECONDS, STAGE_SECONDS, STAGE_RETRIES, LLM_CALLS, LLM_TOKENS, LLM_COST, LLM_QUEUE_SECONDS, LLM_BACKOFFS]
+
+
+# Output: every metric in the Prometheus text exposition format
+def render_prometheus() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.exposition()
+    return '\n'.join(lines) + '\n'
+
+
+class UsageHandler(BaseCallbackHandler):
+    """Adds the token usage of every LLM call it sees to a span."""
+
+    def __init__(self, span):
+        self.span = span
+
+    def on_llm_end(self, response, **kwargs):
+        llm_output = response.llm_output or {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                usage = getattr(message, 'usage_metadata', None)
+                if not usage:
+                    continue
+                model = message.response_metadata.get('model_name') or llm_output.get('model_name') or 'unknown'
+                self.span.add_usage(model, usage.get('input_tokens', 0), usage.get('output_tokens', 0))
+
+
+class Span:
+    def __init__(self, trace, stage, label=None):
+        self.trace = trace
+        self.stage = stage
+        self.label = label
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.seconds = None
+        self.error = None
+        self.callbacks = [UsageHandler(self)] # pass as config={'callbacks': span.callbacks}
+        self._lock = Lock()
+
+    def add_usage(self, model, prompt_tokens, completion_tokens):
+        cost = _cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+        LLM_CALLS.inc(model=model)
+        LLM_TOKENS.inc(prompt_tokens, model=model, type='prompt')
+        LLM_TOKENS.inc(completion_tokens, model=model, type='completion')
+        LLM_COST.inc(cost, model=model)
+
+    def retry(self):
+        self.retries += 1
+        STAGE_RETRIES.inc(kind=self.trace.kind, stage=self.stage)
+
+    def to_dict(self) -> dict:
+        return {
+            'stage': self.stage,
+            'label': self.label,
+            'seconds': self.seconds,
+            'retries': self.retries,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cost_usd': round(self.cost, 6),
+            'error': self.error,
+        }
+
+
+class Trace:
+    """Timings, retries and token usage of one report or chat call.
+
+    Stages are timed with `with trace.stage('summary') as span:`; passing
+    span.callbacks to an LLM or agent call attributes its tokens to that stage.
+    Stages may run on several threads at once.
+    """
+
+    def __init__(self, kind, **attrs):
+        self.kind = kind
+        self.id = uuid.uuid4().hex
+        self.attrs = attrs
+        self.spans = []
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = Lock()
+        self._finished = False
+
+    @contextmanager
+    def stage(self, stage, label=None):
+        span = Span(self, stage, label)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            span.seconds = time.perf_counter() - start
+            STAGE_SECONDS.observe(span.seconds, kind=self.kind, stage=stage)
+            with self._lock:
+                self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'started': self.started,
+            'seconds': time.perf_counter() - self._start,
+            **self.attrs,
+            'prompt_tokens': sum(span['prompt_tokens'] for span in spans),
+            'completion_tokens': sum(span['completion_tokens'] for span in spans),
+            'cost_usd': round(sum(span['cost_usd'] for span in spans), 6),
+            'stages': spans,
+        }
+
+    # records the run's outcome; only the first call counts
+    def finish(self, status='ok'):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        seconds = time.perf_counter() - self._start
+        RUNS.inc(kind=self.kind, status=status)
+        RUN_SECONDS.observe(seconds, kind=self.kind)
+        if TRACE_DIR:
+            trace = self.to_dict()
+            trace['status'] = status
+            try:
+                Path(TRACE_DIR).mkdir(parents=True, exist_ok=True)
+                with open(Path(TRACE_DIR) / f'{self.kind}-{self.id}.json', 'w') as f:
+                    json.dump(trace, f, indent=2, default=str)
+            except OSError as e:
+                print(f'Could not write trace {self.id}: {e}')
+
+
+# Output: invoke config attributing the call's tokens to span (empty without a span)
+def span_config(span) -> dict:
+    return {'callbacks': span.callbacks} if span is not None else {}
@@ -1,44 +1,38 @@
-import base64
-from io import BytesIO
-
-
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
-import numpy as np
 
 #from langchain.tools import tool
 from langchain_core.tools import tool
 
+from .chart_render import render
+from .chart_store import save_chart, CHART_FORMAT, CHART_DPI
+from .chart_data import histogram_bins, box_stats, bar_means, downsample_line, downsample_points
 
-def _plot_to_b64(fig, description: str) -> tuple:
-    """Convert figure to base64 with data quality notice if needed"""
-    buf = BytesIO()
-    fig.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
-    return base64.b64encode(buf.getvalue()).decode('utf-8'), description
+
+def _plot_to_url(spec: dict, description: str) -> tuple:
+    """Render chart spec to a stored image file with data quality notice if needed"""
+    image = render(spec, CHART_FORMAT, CHART_DPI)
+    return save_chart(image, CHART_FORMAT), description
 
 def _check_missing(df: pd.DataFrame, cols: list) -> str:
     """Return warning message if missing data exists"""
     missing = df[cols].isnull().sum().sum()
     return f" (⚠️ {missing} missing values ignored)" if missing > 0 else ""
 
-def make_plotting_tools(injected_df):
-    from .finai_llm import plot_data
-    
-    sns.set_palette("tab10")
+# plot_sink: per-report list that collects (image_url, description) tuples
+def make_plotting_tools(injected_df, plot_sink):
     @tool
     def scatter_plot(title: str, description: str, x_col: str, y_col: str) -> str:
         """Generate scatter plot (auto-drops missing values)."""
         try:
             df = injected_df
             plot_df = df[[x_col, y_col]].dropna()
-            fig = sns.scatterplot(data=plot_df, x=x_col, y=y_col).get_figure()
-            fig.axes[0].set_title(title)
-            plt.xticks(rotation=90)
+            sample_df = downsample_points(plot_df)
+            spec = {'kind': 'scatter', 'title': title, 'data': sample_df, 'x': x_col, 'y': y_col}
             warning = _check_missing(df, [x_col, y_col])
-            result = _plot_to_b64(fig, description + warning)
-            plot_data.append(result)
+            if len(sample_df) < len(plot_df):
+                warning += f"\nNote: Showing a random sample of {len(sample_df)} points."
+            result = _plot_to_url(spec, description + warning)
+            plot_sink.append(result)
             return "Plot was generated successfully."
         
         except Exception as e:
@@ -49,14 +43,12 @@ def make_plotting_tools(injected_df):
         """Generate line plot (auto-drops missing values)."""
         try:
             df = injected_df
-            plot_df = df[[x_col, y_col]].dropna().sort_values(x_col)
-            fig = sns.lineplot(data=plot_df, x=x_col, y=y_col).get_figure()
-            fig.axes[0].set_title(title)
-            plt.xticks(rotation=90)
+            plot_df = downsample_line(df[[x_col, y_col]].dropna().sort_values(x_col), x_col, y_col)
+            spec = {'kind': 'line', 'title': title, 'data': plot_df, 'x': x_col, 'y': y_col}
 
             warning = _check_missing(df, [x_col, y_col])
-            result = _plot_to_b64(fig, description + warning)
-            plot_data.append(result)
+            result = _plot_to_url(spec, description + warning)
+            plot_sink.append(result)
             return "Plot generated successfully"
         except Exception as e:
             return f"Plot generation failed: {str(e)}"
@@ -66,24 +58,24 @@ def make_plotting_tools(injected_df):
         """Generate bar plot (auto-fills missing with 0). y_col must be numeric. Will only show top 5 categories if more exist."""
         try:
             df = injected_df
-            plot_df = df[[x_col, y_col]].fillna(0)
+            plot_df = df[[x_col, y_col]].copy()
+            # only the values are filled, a 0 can't be added to a categorical x column
+            plot_df[y_col] = plot_df[y_col].fillna(0)
 
             # Get top 5 categories by sum of y_col values
             if plot_df[x_col].nunique() > 5:
                 top_categories = plot_df.groupby(x_col)[y_col].sum().nlargest(5).index
                 plot_df = plot_df[plot_df[x_col].isin(top_categories)]
             
-            fig = sns.barplot(data=plot_df, x=x_col, y=y_col, hue=x_col, errorbar=None).get_figure()
-            fig.axes[0].axhline(0, color='black', linewidth=0.8)
-            fig.axes[0].set_title(title)
-            plt.xticks(rotation=90)
+            labels, values = bar_means(plot_df, x_col, y_col)
+            spec = {'kind': 'bar', 'title': title, 'labels': labels, 'values': values, 'x': x_col, 'y': y_col}
 
             warning = _check_missing(df, [x_col, y_col])
             if plot_df[x_col].nunique() > 5:
                 warning += "\nNote: Showing only top 5 categories."
 
-            result = _plot_to_b64(fig, description + warning.replace("ignored", "filled with 0"))
-            plot_data.append(result)
+            result = _plot_to_url(spec, description + warning.replace("ignored", "filled with 0"))
+            plot_sink.append(result)
             return "Plot generated successfully"
         except Exception as e:
             return "Plot generation failed."
@@ -119,25 +111,19 @@ def make_plotting_tools(injected_df):
             # Prepare data for seaborn
             plot_df = plot_df.reset_index().melt(id_vars=x_col, var_name=stack_col, value_name=y_col)
             
-            plt.figure(figsize=(10, 6))
-            ax = sns.barplot(
-                data=plot_df,
-                x=x_col,
-                y=y_col,
-                hue=stack_col,
-                estimator=sum,
-                errorbar=None,
-                dodge=False
-            )
-            
-            ax.axhline(0, color='black', linewidth=0.8)
-            ax.set_title(title)
-            plt.xticks(rotation=90)
-            plt.legend(title=stack_col, bbox_to_anchor=(1.05, 1), loc='upper left')
+            spec = {
+                'kind': 'stacked_bar',
+                'title': title,
+                'figsize': (10, 6),
+                'data': plot_df,
+                'x': x_col,
+                'y': y_col,
+                'stack': stack_col,
+            }
             
             warning = _check_missing(df, [x_col, y_col, stack_col])
-            result = _plot_to_b64(plt.gcf(), description + warning.replace("ignored", "filled with 0"))
-            plot_data.append(result)
+            result = _plot_to_url(spec, description + warning.replace("ignored", "filled with 0"))
+            plot_sink.append(result)
             return "Plot generated successfully"
         except Exception as e:
             return f"Plot generation failed: {str(e)}"
@@ -153,28 +139,26 @@ def make_plotting_tools(injected_df):
             df = injected_df
             if pd.api.types.is_numeric_dtype(df[col]):
                 # Numerical data - use smart binning
-                q75, q25 = np.percentile(df[col].dropna(), [75, 25])
-                bin_width = 2 * (q75 - q25) / (len(df[col]) ** (1/3))
-                bins = int((df[col].max() - df[col].min()) / bin_width)
-                fig = sns.histplot(df[col], bins=min(bins, 30)).get_figure()
-                fig.axes[0].set_title(title)
+                counts, edges = histogram_bins(df[col])
+                spec = {'kind': 'histogram', 'title': title, 'counts': counts, 'edges': edges, 'x': col}
             else:
                 # Categorical data - show top N
                 counts = df[col].value_counts()
                 top = counts.head(n_cats)
-                fig = plt.figure()
-                plt.bar(top.index.astype(str), top.values)
-                if len(counts) > n_cats:
-                    plt.bar("Other", counts[n_cats:].sum())
-                plt.title(title)
-                plt.xticks(rotation=90)
+                spec = {
+                    'kind': 'category_counts',
+                    'title': title,
+                    'labels': list(top.index.astype(str)),
+                    'counts': list(top.values),
+                    'other': counts[n_cats:].sum() if len(counts) > n_cats else None,
+                }
 
             warning = _check_missing(df, [col])
             if not pd.api.types.is_numeric_dtype(df[col]) and df[col].nunique() > n_cats:
                 warning += f"\nNote: Showing only top {n_cats} categories."
 
-            result = _plot_to_b64(fig, description + warning)
-            plot_data.append(result)
+            result = _plot_to_url(spec, description + warning)
+            plot_sink.append(result)
             return "Plot generated successfully"
         except Exception as e:
             return f"Plot generation failed: {str(e)}"
@@ -199,26 +183,16 @@ def make_plotting_tools(injected_df):
             plot_df.columns = [category_col, "count"]  # Rename for barplot
             
             # Plot
-            fig, ax = plt.subplots()
-            sns.barplot(
-                data=plot_df, 
-                x=category_col, 
-                y="count",
-                hue=category_col,
-                errorbar=None,
-                ax=ax
-            )
-            ax.set_title(title)
-            plt.xticks(rotation=90) 
+            spec = {'kind': 'frequency_bar', 'title': title, 'data': plot_df, 'x': category_col}
             
             # Handle missing values warning
             warning = _check_missing(injected_df, [category_col])
             
-            result = _plot_to_b64(
-                fig, 
+            result = _plot_to_url(
+                spec, 
                 description + warning
             )
-            plot_data.append(result)
+            plot_sink.append(result)
             return "Plot generated successfully."
         
         except Exception as e:
@@ -241,29 +215,25 @@ def make_plotting_tools(injected_df):
 
             # Limit to top N categories
             top_cats = df[category_col].value_counts().nlargest(max_categories).index
-            plot_df = df[df[category_col].isin(top_cats)]
 
             # Plot
-            fig, ax = plt.subplots(figsize=(6, 4))
-            sns.boxplot(
-                data=plot_df,
-                x=category_col,
-                y=numeric_col,
-                ax=ax
-            )
-            ax.set_title(title)
-            ax.set_xlabel(category_col)
-            ax.set_ylabel(numeric_col)
-            plt.xticks(rotation=90)
+            spec = {
+                'kind': 'box',
+                'title': title,
+                'figsize': (6, 4),
+                'stats': box_stats(df, category_col, numeric_col, top_cats),
+                'x': category_col,
+                'y': numeric_col,
+            }
 
             # Handle missing values warning
             warning = _check_missing(injected_df, [category_col, numeric_col])
             
-            result = _plot_to_b64(
-                fig,
+            result = _plot_to_url(
+                spec,
                 description + warning
             )
-            plot_data.append(result)
+            plot_sink.append(result)
             return "Plot generated successfully."
         
         except Exception as e:
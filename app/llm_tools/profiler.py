@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+SAMPLE_ROWS = 200_000 # larger frames are profiled on a random sample, None profiles every row
+MAX_VALUE_COUNTS = 15 # get_initial_summary only keeps value counts below this many distinct values
+TEXT_MIN_DISTINCT = 50 # object columns above this (and mostly distinct) are free text, not categories
+
+
+def _column_type(series: pd.Series, n_distinct: int, count: int) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return 'Boolean'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'Numeric'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'DateTime'
+    if count and n_distinct > TEXT_MIN_DISTINCT and n_distinct / count > 0.5:
+        return 'Text'
+    return 'Categorical'
+
+
+def _profile_column(series: pd.Series, count: int, full_series=None) -> dict:
+    value_counts = series.value_counts(dropna=True, sort=True)
+    n_distinct = len(value_counts)
+    sample_count = int(value_counts.sum())
+    column = {
+        'n_distinct': n_distinct,
+        'n_unique': int(np.count_nonzero(value_counts.to_numpy() == 1)),
+        'count': count,
+        'p_distinct': n_distinct / sample_count if sample_count else 0.0,
+        'type': _column_type(series, n_distinct, sample_count),
+    }
+    if n_distinct < MAX_VALUE_COUNTS:
+        if full_series is not None:
+            # few distinct values, so an exact count over every row is cheap
+            value_counts = full_series.value_counts(dropna=True, sort=True)
+        column['value_counts_without_nan'] = {
+            str(value): int(n) for value, n in value_counts.items()
+        }
+    return column
+
+
+# Input: dataframe to profile
+# Output: dict with the same 'variables' layout as ydata's ProfileReport json,
+# limited to the fields get_initial_summary reads.
+# With sample_rows set, distinct/unique stats come from a random sample of that size;
+# counts and the value counts of low cardinality columns are taken over the full frame.
+def profile_dataframe(df: pd.DataFrame, sample_rows=SAMPLE_ROWS) -> dict:
+    counts = df.notna().sum()
+    sampled = sample_rows is not None and len(df) > sample_rows
+    sample = df.sample(n=sample_rows, random_state=0) if sampled else df
+
+    variables = {
+        col: _profile_column(sample[col], int(counts[col]), df[col] if sampled else None)
+        for col in df.columns
+    }
+    return {
+        'table': {
+            'n': len(df),
+            'n_var': len(df.columns),
+            'n_cells_missing': int(len(df) * len(df.columns) - counts.sum()),
+            'sampled_rows': len(sample) if sampled else None,
+        },
+        'variables': variables,
+    }
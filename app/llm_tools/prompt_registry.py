@@ -0,0 +1,61 @@
+import json
+import hashlib
+from pathlib import Path
+from threading import Lock
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+
+# the path to the prompts dir
+PROMPT_DIR = Path(__file__).resolve().parent / 'prompts'
+
+# templates are compiled once; auto_reload makes jinja recompile one only when its mtime changes,
+# and the bytecode cache lets new worker processes skip the compile step as well
+_env = Environment(
+    loader=FileSystemLoader(PROMPT_DIR),
+    auto_reload=True,
+    cache_size=-1,
+    bytecode_cache=FileSystemBytecodeCache(),
+)
+
+_files = {} # name -> (mtime, text, parsed json or None, version)
+_lock = Lock()
+
+
+def _load(name):
+    path = PROMPT_DIR / name
+    mtime = path.stat().st_mtime_ns
+    cached = _files.get(name)
+    if cached is None or cached[0] != mtime:
+        text = path.read_text()
+        parsed = json.loads(text) if path.suffix == '.json' else None
+        cached = (mtime, text, parsed, hashlib.sha256(text.encode('utf-8')).hexdigest()[:16])
+        with _lock:
+            _files[name] = cached
+    return cached
+
+
+# Output: the prompt file as is (for prompts without template variables)
+def read_prompt(name) -> str:
+    return _load(name)[1]
+
+
+def render_prompt(name, **context) -> str:
+    return _env.get_template(name).render(**context)
+
+
+# Output: parsed json prompt file, re-read only when it changes
+def load_json(name):
+    return _load(name)[2]
+
+
+# Output: short content hash of a prompt file, changes whenever the file does
+def template_version(name) -> str:
+    return _load(name)[3]
+
+
+def prompt_versions() -> dict:
+    return {
+        path.name: template_version(path.name)
+        for path in sorted(PROMPT_DIR.iterdir()) if path.is_file()
+    }
@@ -0,0 +1,88 @@
+import re
+from html import escape
+from textwrap import dedent
+
+from markdown2 import markdown
+
+
+MARKDOWN_EXTRAS = ["tables"]
+# h2 titles matching a pattern get its class (styled by finai_report.html)
+HEADER_CLASSES = [
+    (re.compile(r'insight', re.IGNORECASE), 'insights'),
+    (re.compile(r'overview', re.IGNORECASE), 'overview'),
+]
+_FENCE = re.compile(r'^\s*(```|~~~)')
+_EMPHASIS = re.compile(r'[*_`]+')
+
+
+def create_plot_div(image_url: str, description: str) -> str:
+    return dedent(f'''
+    <div class="plot-container">
+        <div class="plot">
+            <img class="plot-img" src="{image_url}" loading="lazy"/>
+            <p class="plot-desc">{description}</p>
+        </div>
+    </div>
+    ''')
+
+
+# Input: markdown document
+# Output: list of (h2 title or None for text before the first one, body markdown)
+def split_sections(text: str) -> list:
+    sections = []
+    title, body = None, []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE.match(line):
+            in_fence = not in_fence
+        if not in_fence and line.startswith('## '):
+            if title is not None or any(part.strip() for part in body):
+                sections.append((title, '\n'.join(body)))
+            title, body = line[3:].strip().strip('#').strip(), []
+        else:
+            body.append(line)
+    if title is not None or any(part.strip() for part in body):
+        sections.append((title, '\n'.join(body)))
+    return sections
+
+
+def header_class(title: str):
+    for pattern, css_class in HEADER_CLASSES:
+        if pattern.search(title):
+            return css_class
+    return None
+
+
+# Output: html of one section; the h2 is written here with its class, markdown
+# only converts the body, so no pass over the finished html is needed
+def render_section(title, body: str) -> str:
+    html = markdown(body, extras=MARKDOWN_EXTRAS, safe_mode=False) if body.strip() else ''
+    if title is None:
+        return html
+    text = escape(_EMPHASIS.sub('', title))
+    css_class = header_class(title)
+    header = f'<h2 class="{css_class}">{text}</h2>' if css_class else f'<h2>{text}</h2>'
+    return f'{header}\n{html}'
+
+
+# Input: executive summary markdown and the (image_url, description) charts
+# Output: report html. The last chart closes the report and the one before it opens
+# the insights (or follows the other sections when there is no insights header).
+def render_report(executive_summary: str, charts) -> str:
+    charts = list(charts)
+    closing = create_plot_div(*charts.pop()) if charts else ''
+    before_insights = create_plot_div(*charts.pop()) if charts else ''
+
+    parts = []
+    for title, body in split_sections(executive_summary):
+        if before_insights and title is not None and header_class(title) == 'insights':
+            parts.append(before_insights)
+            before_insights = ''
+        parts.append(render_section(title, body))
+    parts += [before_insights, closing]
+    return '\n'.join(part for part in parts if part)
+
+
+# Output: html of an answered question for the progressive report page
+def render_answer(question: str, answer: str) -> str:
+    return f'<h3>{escape(question)}</h3>\n' + markdown(answer, extras=MARKDOWN_EXTRAS, safe_mode=False)
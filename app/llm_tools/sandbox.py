@@ -0,0 +1,221 @@
+import os
+import uuid
+import pickle
+import hashlib
+import weakref
+import tempfile
+import multiprocessing
+from threading import Lock
+from typing import Optional, Type
+
+import pandas as pd
+from pydantic import BaseModel
+from langchain_core.tools import BaseTool
+from langchain_core.callbacks.manager import CallbackManagerForToolRun
+from langchain_experimental.tools.python.tool import PythonInputs, sanitize_input
+
+from .sandbox_worker import worker_main
+
+
+# agent written pandas code runs in these worker processes instead of the web process;
+# 0 runs it in-process with langchain's PythonAstREPLTool
+SANDBOX_WORKERS = 4
+CPU_SECONDS = 20 # cpu time per tool call
+TASK_TIMEOUT = 30 # wall clock seconds per tool call before the worker is killed
+STARTUP_TIMEOUT = 120 # seconds a new worker may take to import its libraries
+MEMORY_LIMIT = 4 * 1024 * 1024 * 1024 # address space per worker, None disables the limit
+MAX_TASKS_PER_WORKER = 200 # workers are replaced after this many calls
+# datasets are handed to the workers through files here (tmpfs, so it's memory, not disk)
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+TOOL_DESCRIPTION = (
+    "A Python shell. Use this to execute python commands. "
+    "Input should be a valid python command. "
+    "When using this tool, sometimes output is abbreviated - "
+    "make sure it does not look abbreviated before using it in your answer."
+)
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(child_conn, MEMORY_LIMIT, CPU_SECONDS, MAX_TASKS_PER_WORKER),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.sessions = set()
+        self.dropped = [] # sessions to forget, sent along with the next call
+
+    def wait_ready(self) -> bool:
+        if not self.ready and self.conn.poll(STARTUP_TIMEOUT):
+            self.conn.recv()
+            self.ready = True
+        return self.ready
+
+    def stop(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class SandboxPool:
+    """Pre-started worker processes running agent code under cpu, memory and time limits.
+
+    Each tool session is pinned to one worker so its variables persist between calls;
+    they are lost (and the agent sees a fresh namespace) when that worker is replaced.
+    """
+
+    def __init__(self, workers=SANDBOX_WORKERS):
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = Lock()
+        self._workers = [_Worker(self._context) for _ in range(workers)]
+        self._slot_locks = [Lock() for _ in range(workers)] # one call at a time per worker
+        self._assigned = {} # session id -> worker slot
+
+    def _slot(self, session_id) -> int:
+        with self._lock:
+            if session_id not in self._assigned:
+                slot = min(range(len(self._workers)), key=lambda i: len(self._workers[i].sessions))
+                self._workers[slot].sessions.add(session_id)
+                self._assigned[session_id] = slot
+            return self._assigned[session_id]
+
+    def _replace(self, slot):
+        worker = self._workers[slot]
+        worker.stop()
+        fresh = _Worker(self._context)
+        with self._lock:
+            fresh.sessions = worker.sessions
+            self._workers[slot] = fresh
+
+    def run(self, session_id, token, path, code) -> str:
+        slot = self._slot(session_id)
+        with self._slot_locks[slot]:
+            with self._lock:
+                worker = self._workers[slot]
+                dropped, worker.dropped = worker.dropped, []
+            try:
+                if not worker.wait_ready():
+                    self._replace(slot)
+                    return 'Error: the python worker did not start in time, try again'
+                worker.conn.send((session_id, token, path, code, dropped))
+                if not worker.conn.poll(TASK_TIMEOUT):
+                    self._replace(slot)
+                    return f'TimeoutError: the code ran for more than {TASK_TIMEOUT}s and was stopped'
+                output, recycle = worker.conn.recv()
+            except (EOFError, OSError, BrokenPipeError):
+                # killed by the kernel (e.g. out of memory) or by its rlimits
+                self._replace(slot)
+                return 'Error: the python worker crashed while running this code, variables were reset'
+            if recycle:
+                self._replace(slot)
+            return output
+
+    def drop(self, session_id):
+        with self._lock:
+            slot = self._assigned.pop(session_id, None)
+            if slot is None:
+                return
+            worker = self._workers[slot]
+            worker.sessions.discard(session_id)
+            worker.dropped.append(session_id)
+
+    def shutdown(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = Lock()
+_published = {} # content hash -> [path of the pickled copy in SHARED_DIR, live dataframes using it]
+_frame_hashes = {} # id(df) -> content hash, until df is garbage collected
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+        return _pool
+
+
+# Output: sha256 of df's columns, dtypes, index and values; equal frames (e.g. the same
+# upload parsed twice) get the same hash, frames with unhashable cells a unique one
+def dataframe_hash(df: pd.DataFrame) -> str:
+    digest = hashlib.sha256(repr((list(df.columns), [str(dtype) for dtype in df.dtypes])).encode('utf-8'))
+    try:
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    except TypeError: # lists or dicts in object columns
+        return uuid.uuid4().hex
+    return digest.hexdigest()
+
+
+def _release(key):
+    with _pool_lock:
+        content_hash = _frame_hashes.pop(key)
+        entry = _published[content_hash]
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _published[content_hash]
+    try:
+        os.unlink(entry[0])
+    except OSError:
+        pass
+
+
+# Output: (token, path) of a pickled copy of df the workers load. The copy is keyed by
+# content, so every tool on the same data (per question agents, the chat agent, a
+# re-upload) shares one file and the workers' cached frame; it is deleted once no
+# dataframe with that content is alive
+def publish_dataframe(df: pd.DataFrame):
+    key = id(df)
+    with _pool_lock:
+        content_hash = _frame_hashes.get(key)
+    if content_hash is None:
+        content_hash = dataframe_hash(df) # outside the lock, it reads the whole frame
+    with _pool_lock:
+        if key not in _frame_hashes:
+            _frame_hashes[key] = content_hash
+            weakref.finalize(df, _release, key)
+            entry = _published.get(content_hash)
+            if entry is not None:
+                entry[1] += 1
+            else:
+                fd, path = tempfile.mkstemp(prefix='finai-df-', suffix='.pkl', dir=SHARED_DIR)
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+                _published[content_hash] = [path, 1]
+        return content_hash, _published[content_hash][0]
+
+
+class SandboxedPythonTool(BaseTool):
+    """Drop-in for PythonAstREPLTool that runs the code on the sandbox pool."""
+
+    name: str = 'python_repl_ast'
+    description: str = TOOL_DESCRIPTION
+    args_schema: Type[BaseModel] = PythonInputs
+    token: str
+    path: str
+    session_id: str
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        return get_pool().run(self.session_id, self.token, self.path, sanitize_input(query))
+
+
+# Input: dataframe the agent works on
+# Output: python tool with its own namespace ('df' bound), sandboxed unless SANDBOX_WORKERS is 0
+def make_python_tool(df: pd.DataFrame) -> BaseTool:
+    if SANDBOX_WORKERS <= 0:
+        from langchain_experimental.tools import PythonAstREPLTool
+        return PythonAstREPLTool(locals={'df': df})
+    pool = get_pool()
+    token, path = publish_dataframe(df)
+    tool = SandboxedPythonTool(token=token, path=path, session_id=uuid.uuid4().hex)
+    weakref.finalize(tool, pool.drop, tool.session_id)
+    return tool
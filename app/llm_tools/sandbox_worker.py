@@ -0,0 +1,108 @@
+import ast
+import pickle
+import signal
+from io import StringIO
+from collections import OrderedDict
+from contextlib import redirect_stdout
+
+try:
+    import resource
+except ImportError: # not available on Windows, workers then run without rlimits
+    resource = None
+
+import pandas as pd
+
+
+# runs inside the sandbox processes, so it only imports what agent code needs
+WORKER_DATASETS = 2 # datasets each worker keeps loaded
+CPU_SECONDS = 20 # replaced by the pool's setting when the worker starts
+
+
+class CPUTimeExceeded(Exception):
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded(f'the code used more than {CPU_SECONDS}s of cpu time')
+
+
+def _limit_cpu(hard):
+    # the soft limit counts the process' whole cpu time, so it is moved forward before every call
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(used.ru_utime + used.ru_stime) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (used + CPU_SECONDS, hard))
+
+
+# same evaluation as PythonAstREPLTool: run every statement, return the last expression
+def _execute(code, namespace) -> str:
+    tree = ast.parse(code)
+    exec(ast.unparse(ast.Module(tree.body[:-1], type_ignores=[])), namespace)
+    last = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+    io_buffer = StringIO()
+    try:
+        with redirect_stdout(io_buffer):
+            result = eval(last, namespace)
+    except Exception:
+        with redirect_stdout(io_buffer):
+            exec(last, namespace)
+        return io_buffer.getvalue()
+    return io_buffer.getvalue() if result is None else str(result)
+
+
+# Input: pipe to the web process and the limits to run under
+# Receives (session id, dataset token, dataset path, code, dropped session ids) and
+# answers (output, recycle); returns after max_tasks calls or when recycle is set
+def worker_main(conn, memory_limit, cpu_seconds, max_tasks):
+    global CPU_SECONDS
+    CPU_SECONDS = cpu_seconds
+    import numpy # noqa: F401 -- loaded once here instead of in the first tool call
+    if int(pd.__version__.split('.')[0]) < 3: # always on from pandas 3
+        pd.set_option('mode.copy_on_write', True)
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        conn.send(None) # ready, startup doesn't count against the first call's timeout
+    except OSError:
+        return # the pool was shut down while this worker started
+
+    datasets = OrderedDict() # token -> df, least recently used first
+    sessions = {} # session id -> namespace of one tool
+    for tasks in range(1, max_tasks + 1):
+        try:
+            session_id, token, path, code, dropped = conn.recv()
+        except EOFError:
+            return
+        for dropped_id in dropped:
+            sessions.pop(dropped_id, None)
+
+        recycle = tasks == max_tasks
+        try:
+            if token not in datasets:
+                with open(path, 'rb') as f:
+                    datasets[token] = pickle.load(f)
+                while len(datasets) > WORKER_DATASETS:
+                    datasets.popitem(last=False)
+            datasets.move_to_end(token)
+            if session_id not in sessions:
+                # a shallow copy under copy-on-write: a session's in-place edits copy the
+                # columns they touch, so other sessions on the same token keep the loaded frame
+                sessions[session_id] = {'df': datasets[token].copy(deep=False), 'pd': pd}
+            namespace = sessions[session_id]
+            if resource is not None:
+                _limit_cpu(cpu_hard)
+            output = _execute(code, namespace)
+        except MemoryError:
+            # the heap may be fragmented past the limit now, start over in a fresh process
+            output = f'MemoryError: the code needed more than {memory_limit // (1024 * 1024)}MB'
+            recycle = True
+        except Exception as e:
+            output = f'{type(e).__name__}: {e}'
+        finally:
+            if resource is not None:
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+        conn.send((output, recycle))
+        if recycle:
+            return
@@ -0,0 +1,6 @@
+# model settings shared by the web routes, the report jobs and the agents;
+# imports nothing, so reading them doesn't load the analytics stack
+
+your_api_key = "INSERT HERE YOUR OPENAI API KEY"
+
+DEFAULT_MODEL = 'gpt-4o'
@@ -0,0 +1,51 @@
+import os
+import time
+import importlib
+import multiprocessing
+from threading import Thread
+
+
+# FINAI_PREWARM=1 imports the analytics stack in the background after startup,
+# =full also starts the sandbox workers; unset, everything loads on first use
+PREWARM = os.environ.get('FINAI_PREWARM', '').lower()
+PREWARM_DELAY = 2.0 # seconds to wait first, so the worker answers its first requests before the imports
+PREWARM_MODULES = [
+    'app.llm_tools.finai_llm', # pandas, langchain, openai, matplotlib, seaborn, bs4
+    'app.llm_tools.ingest',
+    'app.llm_tools.metrics',
+]
+
+_started = False
+
+
+def prewarm(full=False, delay=0.0):
+    time.sleep(delay)
+    start = time.perf_counter()
+    try:
+        for name in PREWARM_MODULES:
+            importlib.import_module(name)
+        if full:
+            from app.llm_tools.sandbox import get_pool
+            get_pool()
+    except Exception as e:
+        print(f'Pre-warm failed, modules will load on first use: {e}')
+        return
+    print(f'Pre-warmed the analytics stack in {time.perf_counter() - start:.2f}s')
+
+
+# Output: the pre-warm thread, None when FINAI_PREWARM is off, it already ran or
+# this is a child process (sandbox and chart workers load only what they use)
+def start_prewarm(mode=None):
+    global _started
+    mode = PREWARM if mode is None else mode
+    if mode in ('', '0', 'false', 'no') or _started or multiprocessing.parent_process() is not None:
+        return None
+    _started = True
+    thread = Thread(
+        target=prewarm,
+        kwargs={'full': mode == 'full', 'delay': PREWARM_DELAY},
+        daemon=True,
+        name='finai-prewarm',
+    )
+    thread.start()
+    return thread
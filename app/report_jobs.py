@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import traceback
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from app import result_cache
+from app.llm_tools.settings import DEFAULT_MODEL
+
+
+REPORT_WORKERS = 2 # reports built at the same time, the rest wait in the queue
+JOB_TTL = 60 * 60 # seconds a finished job (and its report) is kept around
+
+STAGE_LABELS = {
+    'queued': 'Waiting for a free worker',
+    'ingesting': 'Reading the file',
+    'profiling': 'Profiling the data',
+    'questions': 'Generating questions',
+    'qa': 'Answering questions',
+    'summary': 'Writing the executive summary',
+    'plots': 'Drawing the charts',
+    'rendering': 'Rendering the report',
+    'done': 'Report ready',
+    'failed': 'Report failed',
+}
+
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix='finai-report')
+# job state lives in this process, so the progress page's status and sections polls
+# must reach the process that took the job: the app runs as one process (threads are fine)
+_jobs = {}
+_lock = Lock()
+
+
+def _prune_jobs():
+    now = time.time()
+    with _lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job['finished'] is not None and now - job['finished'] > JOB_TTL
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+
+
+def _update_job(job_id, **fields):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+
+def _add_section(job_id, section):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job['sections'].append(section)
+
+
+def _notify(job_id, on_finish):
+    if on_finish is None:
+        return
+    try:
+        on_finish(get_job(job_id))
+    except Exception:
+        traceback.print_exc() # the job itself is done, a failing listener doesn't change that
+
+
+def _run_job(job_id, csv_path, cache_key, report_kwargs, on_finish=None):
+    # the analytics stack is loaded by the first job, not when the web app starts
+    from app.llm_tools.finai_llm import generate_report
+    from app.llm_tools.ingest import read_table
+    from app.llm_tools.metrics import Trace
+
+    def progress(stage, done=None, total=None):
+        _update_job(job_id, stage=stage, done=done, total=total)
+
+    _update_job(job_id, status='running', started=time.time())
+    trace = Trace('report', job=job_id, model=report_kwargs.get('model', DEFAULT_MODEL))
+    try:
+        progress('ingesting')
+        with trace.stage('ingest'):
+            df = read_table(csv_path)
+        result = generate_report(df, progress=progress, trace=trace,
+                                 on_section=lambda section: _add_section(job_id, section), **report_kwargs)
+    except Exception as e:
+        traceback.print_exc()
+        trace.finish('failed')
+        _update_job(job_id, status='failed', stage='failed', error=str(e), finished=time.time())
+        _notify(job_id, on_finish)
+        return
+    finally:
+        os.unlink(csv_path)
+    trace.finish()
+    if cache_key is not None:
+        result_cache.put(cache_key, 'report', result)
+    _update_job(job_id, status='done', stage='done', result=result, finished=time.time())
+    _notify(job_id, on_finish)
+
+
+def _new_job(user_id, filename, **fields):
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'user_id': user_id,
+        'filename': filename,
+        'model': DEFAULT_MODEL,
+        'status': 'queued',
+        'stage': 'queued',
+        'done': None,
+        'total': None,
+        'error': None,
+        'result': None,
+        'sections': [], # answers and charts shown while the report is built
+        'cached': False,
+        'created': time.time(),
+        'started': None,
+        'finished': None,
+    }
+    job.update(fields)
+    with _lock:
+        _jobs[job_id] = job
+    return job_id
+
+
+# Input: spooled copy of the uploaded file (see ingest.spool_upload), its content hash
+# and the submitting user. The job owns csv_path and deletes it when done.
+# Output: job id (str), the report is built on the worker pool
+# unless an identical report is already in the result cache
+# on_finish(job) is called with the finished (done or failed) job, from the worker thread
+def submit_report(csv_path, file_hash, user_id=None, filename=None, model=DEFAULT_MODEL, on_finish=None, **report_kwargs):
+    _prune_jobs()
+    cache_key = result_cache.make_key('report', file_hash, model)
+    cached = result_cache.get(cache_key, 'report')
+    if cached is not None:
+        os.unlink(csv_path)
+        now = time.time()
+        job_id = _new_job(
+            user_id, filename, model=model, status='done', stage='done', result=cached,
+            cached=True, created=now, started=now, finished=now
+        )
+        _notify(job_id, on_finish)
+        return job_id
+
+    job_id = _new_job(user_id, filename, model=model)
+    _executor.submit(_run_job, job_id, csv_path, cache_key, dict(report_kwargs, model=model, user=user_id), on_finish)
+    return job_id
+
+
+# Output: copy of the job dict, None if it doesn't exist or belongs to another user
+def get_job(job_id, user_id=None):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or (user_id is not None and job['user_id'] != user_id):
+            return None
+        return dict(job, sections=list(job['sections']))
+
+
+# Output: json-friendly job status without the report body
+def job_status(job):
+    label = STAGE_LABELS.get(job['stage'], job['stage'])
+    if job['stage'] == 'qa' and job['total']:
+        label = f"{label} {job['done']}/{job['total']}"
+    status = {key: value for key, value in job.items() if key not in ('result', 'user_id', 'sections')}
+    status['label'] = label
+    status['sections'] = len(job['sections'])
+    return status
+
+
+# Output: the sections finished after the first `after` ones, with their position
+def job_sections(job, after=0):
+    return [dict(section, index=i) for i, section in enumerate(job['sections'][after:], start=after)]
@@ -0,0 +1,140 @@
+import time
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from threading import Lock
+from contextlib import contextmanager
+
+from app.llm_tools.prompt_registry import prompt_versions
+
+
+# lives next to FinAI.sqlite3 in the flask instance folder
+CACHE_PATH = Path(__file__).resolve().parent.parent / 'instance' / 'finai_cache.sqlite3'
+MAX_CACHE_BYTES = 512 * 1024 * 1024 # least recently used entries are evicted past this size
+
+_init_lock = Lock()
+_initialized = False
+
+
+@contextmanager
+def _connect():
+    global _initialized
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS cache_entries (
+                        key TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_last_access ON cache_entries (last_access)')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS cache_stats (
+                        kind TEXT PRIMARY KEY,
+                        hits INTEGER NOT NULL DEFAULT 0,
+                        misses INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                conn.commit()
+                _initialized = True
+    try:
+        with conn: # commits on success, rolls back on error
+            yield conn
+    finally:
+        conn.close()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# Input: result kind ('report' or 'chat'), hash of the uploaded file, model name and optional query
+# Output: cache key (str)
+def make_key(kind, file_hash, model, query=None) -> str:
+    key_data = json.dumps({
+        'kind': kind,
+        'file': file_hash,
+        'model': model,
+        'prompts': prompt_versions(), # editing a prompt invalidates what it produced
+        'query': query,
+    }, sort_keys=True)
+    return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+
+def _count(conn, kind, column):
+    conn.execute(
+        f'INSERT INTO cache_stats (kind, {column}) VALUES (?, 1) '
+        f'ON CONFLICT(kind) DO UPDATE SET {column} = {column} + 1',
+        (kind,)
+    )
+
+
+# Output: cached value (str), None on a miss
+def get(key, kind):
+    with _connect() as conn:
+        row = conn.execute('SELECT value FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            _count(conn, kind, 'misses')
+            return None
+        conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        _count(conn, kind, 'hits')
+        return row[0]
+
+
+def put(key, kind, value: str):
+    size = len(value.encode('utf-8'))
+    if size > MAX_CACHE_BYTES:
+        return
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO cache_entries (key, kind, value, size, created, last_access) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, kind, value, size, now, now)
+        )
+        _evict(conn)
+
+
+def _evict(conn):
+    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache_entries').fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+    rows = conn.execute('SELECT key, size FROM cache_entries ORDER BY last_access').fetchall()
+    evicted = []
+    for key, size in rows:
+        if total <= MAX_CACHE_BYTES:
+            break
+        evicted.append((key,))
+        total -= size
+    conn.executemany('DELETE FROM cache_entries WHERE key = ?', evicted)
+
+
+# Output: cached values containing fragment, read lazily so callers can scan a full cache
+def values_containing(fragment):
+    with _connect() as conn:
+        for (value,) in conn.execute(
+            "SELECT value FROM cache_entries WHERE instr(value, ?) > 0", (fragment,)
+        ):
+            yield value
+
+
+# Output: hit/miss counts per kind plus the number and size of stored entries
+def stats() -> dict:
+    with _connect() as conn:
+        entries, size = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries'
+        ).fetchone()
+        counts = {
+            kind: {'hits': hits, 'misses': misses}
+            for kind, hits, misses in conn.execute('SELECT kind, hits, misses FROM cache_stats')
+        }
+    return {'entries': entries, 'bytes': size, 'max_bytes': MAX_CACHE_BYTES, 'counts': counts}
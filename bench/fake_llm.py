@@ -0,0 +1,143 @@
+import re
+import json
+import time
+import uuid
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage, AIMessageChunk, BaseMessage, FunctionMessage, SystemMessage, ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+CHARS_PER_TOKEN = 4 # rough usage estimate, close enough for cost trends
+
+SUMMARY_TEMPLATE = '''## Data Overview
+The table holds {rows} of transactions across accounts, categories and regions.
+
+## Insights
+- Spending is concentrated in a few categories.
+- Amounts are right skewed with a long tail of large transactions.
+- Activity is spread evenly over the period covered.
+'''
+
+
+def _text(message: BaseMessage) -> str:
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI used by the benchmarks.
+
+    Replies depend only on the request: pandas agent calls first run agent_code with
+    the python tool and then answer, tool calling agents replay tool_script, question
+    generation gets a json object and the executive summary a fixed two section report.
+    Every call sleeps latency seconds (plus token_latency per streamed chunk).
+    """
+
+    model_name: str = 'gpt-4o'
+    latency: float = 0.0
+    token_latency: float = 0.0
+    streaming: bool = False
+    agent_code: str = 'df.describe()'
+    tool_script: List[dict] = [] # [{'name': tool name, 'args': {...}}] for tool calling agents
+
+    @property
+    def _llm_type(self) -> str:
+        return 'scripted-fake'
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _reply(self, messages: List[BaseMessage], kwargs: dict) -> AIMessage:
+        if kwargs.get('functions'):
+            # openai functions agent (pandas agent): one python call, then the answer
+            observations = [m for m in messages if isinstance(m, FunctionMessage)]
+            if not observations:
+                return AIMessage(content='', additional_kwargs={'function_call': {
+                    'name': 'python_repl_ast',
+                    'arguments': json.dumps({'query': self.agent_code}),
+                }})
+            return AIMessage(content=f'From the data:\n\n{_text(observations[-1])[:1500]}')
+
+        if kwargs.get('tools'):
+            names = {tool['function']['name'] for tool in kwargs['tools']}
+            if not any(isinstance(m, ToolMessage) for m in messages):
+                calls = [
+                    {'name': step['name'], 'args': step['args'], 'id': f'call_{uuid.uuid4().hex[:12]}'}
+                    for step in self.tool_script if step['name'] in names
+                ]
+                if calls:
+                    return AIMessage(content='', tool_calls=calls)
+            return AIMessage(content='Done.')
+
+        system = ' '.join(_text(m) for m in messages if isinstance(m, SystemMessage))
+        prompt = _text(messages[-1])
+        if 'json' in system and 'questions' in system:
+            match = re.search(r'"1" to "(\d+)"', prompt)
+            count = int(match.group(1)) if match else 3
+            return AIMessage(content=json.dumps({
+                str(i): f'Which category has the largest total amount? (variant {i})'
+                for i in range(1, count + 1)
+            }))
+        if 'summary report' in system:
+            rows = re.search(r'\*\*([\d,]+) rows\*\*', prompt)
+            return AIMessage(content=SUMMARY_TEMPLATE.format(rows=rows.group(1) + ' rows' if rows else 'a set'))
+        return AIMessage(content=f'Answer to: {prompt[:200]}')
+
+    def _usage(self, messages, reply: AIMessage) -> dict:
+        prompt_tokens = sum(len(_text(m)) for m in messages) // CHARS_PER_TOKEN
+        completion_tokens = (len(reply.content) + len(json.dumps(reply.additional_kwargs))) // CHARS_PER_TOKEN
+        return {
+            'input_tokens': prompt_tokens,
+            'output_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        reply = self._reply(messages, kwargs)
+        reply.usage_metadata = self._usage(messages, reply)
+        reply.response_metadata = {'model_name': self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        reply = self._reply(messages, kwargs)
+        if reply.additional_kwargs or reply.tool_calls:
+            # function and tool calls arrive as one chunk
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content='',
+                additional_kwargs=reply.additional_kwargs,
+                tool_call_chunks=[
+                    {'name': call['name'], 'args': json.dumps(call['args']), 'id': call['id'], 'index': i}
+                    for i, call in enumerate(reply.tool_calls)
+                ],
+            ))
+        else:
+            for word in re.findall(r'\S+\s*', reply.content):
+                time.sleep(self.token_latency)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content='',
+            usage_metadata=self._usage(messages, reply),
+            response_metadata={'model_name': self.model_name},
+        ))
+
+
+# Output: factory for clients.set_chat_model_factory; accepts (and ignores) the
+# ChatOpenAI-only settings like api_key and http_client
+def scripted_model_factory(latency=0.0, token_latency=0.0, **fields):
+    def factory(model, streaming=False, **settings):
+        return ScriptedChatModel(
+            model_name=model,
+            streaming=streaming,
+            latency=latency,
+            token_latency=token_latency,
+            **fields
+        )
+    return factory
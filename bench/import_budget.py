@@ -0,0 +1,93 @@
+"""Startup import budget of the web app.
+
+Imports run.py in fresh interpreters and fails when it takes longer than the budget,
+grows the process past the memory budget or loads one of the analytics packages,
+which the routes import on first use (see app/prewarm.py).
+
+    python -m bench.import_budget
+    python -m bench.import_budget --seconds 1.0 --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+IMPORT_SECONDS = 1.5 # best of the runs, cold disk caches are not what this measures
+IMPORT_RSS_MB = 120
+RUNS = 3
+# must not be imported by `import run`
+HEAVY_MODULES = [
+    'pandas', 'numpy', 'matplotlib', 'seaborn', 'bs4', 'ydata_profiling',
+    'langchain', 'langchain_core', 'langchain_openai', 'langchain_experimental', 'openai',
+]
+
+PROBE = '''
+import sys, json, time, resource
+start = time.perf_counter()
+import run
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'seconds': seconds,
+    'rss_mb': peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024,
+    'modules': sorted(name for name in sys.modules if name.split('.')[0] in %r),
+}))
+''' % (HEAVY_MODULES,)
+
+
+def _probe(importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=str(ROOT), FINAI_PREWARM=''))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+# Output: (cumulative microseconds, module) of the slowest imports in -X importtime output
+def _slowest(importtime_log, top):
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=IMPORT_SECONDS)
+    parser.add_argument('--rss-mb', type=float, default=IMPORT_RSS_MB)
+    parser.add_argument('--runs', type=int, default=RUNS)
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    args = parser.parse_args(argv)
+
+    probes = [_probe()[0] for _ in range(args.runs)]
+    seconds = min(probe['seconds'] for probe in probes)
+    rss_mb = min(probe['rss_mb'] for probe in probes)
+    heavy = probes[0]['modules']
+    print(f'import run: {seconds:.3f}s (budget {args.seconds}s), {rss_mb:.0f} MB (budget {args.rss_mb:.0f} MB)')
+
+    _, importtime_log = _probe(importtime=True)
+    for cumulative, name in _slowest(importtime_log, args.top):
+        print(f'  {cumulative / 1e6:7.3f}s  {name}')
+
+    failures = []
+    if seconds > args.seconds:
+        failures.append(f'import took {seconds:.3f}s, budget {args.seconds}s')
+    if rss_mb > args.rss_mb:
+        failures.append(f'peak memory {rss_mb:.0f} MB, budget {args.rss_mb:.0f} MB')
+    if heavy:
+        failures.append('loaded at startup: ' + ', '.join(heavy))
+    for failure in failures:
+        print(f'OVER BUDGET {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Offline benchmarks for the report and chat pipelines.
+
+Swaps ChatOpenAI for bench.fake_llm.ScriptedChatModel (no network, fixed latency),
+builds synthetic ledgers of each size and records per-stage timings, peak memory
+and throughput under concurrent load against the Flask routes.
+
+    python -m bench.run_bench --sizes 1k,100k,1m --out bench_output.json
+    python -m bench.run_bench --baseline bench/baseline.json   # exit code 1 on regressions
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bench.fake_llm import scripted_model_factory
+from bench.synth import write_csv
+
+
+DATA_DIR = Path(tempfile.gettempdir()) / 'finai-bench'
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000, '5m': 5_000_000}
+TOLERANCE = 0.2 # relative slowdown allowed before a metric counts as a regression
+
+
+def _peak_rss_mb() -> float:
+    # high-water mark of the whole process, so sizes are run smallest first
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+def _isolate_storage(root: Path):
+    # keep benchmark caches, charts, spilled datasets and history rows (user_id -1) out of
+    # the real instance folder; the database is chosen when run is imported, so set it first
+    if 'run' in sys.modules:
+        raise RuntimeError('run was imported before the benchmark storage was isolated')
+    os.environ['FINAI_DATABASE_URI'] = f'sqlite:///{root / "FinAI.sqlite3"}'
+    from app import result_cache, dataset_store
+    from app.llm_tools import chart_store
+    result_cache.CACHE_PATH = root / 'cache.sqlite3'
+    dataset_store.SPILL_DIR = root / 'datasets'
+    chart_store.CHART_DIR = root / 'charts'
+
+
+# the plotting agent replays the charts the rule based planner would pick
+def _use_planned_tool_script(df, model_settings):
+    from app.llm_tools.profiler import profile_dataframe
+    from app.llm_tools.chart_planner import plan_charts, NUM_CHARTS
+    from app.llm_tools.clients import set_chat_model_factory
+    plan = plan_charts(df, profile_dataframe(df))[:NUM_CHARTS]
+    script = [{'name': name, 'args': args} for name, args in plan]
+    set_chat_model_factory(scripted_model_factory(tool_script=script, **model_settings))
+
+
+def bench_report(rows: int, plot_mode: str, model_settings: dict) -> dict:
+    from app.llm_tools.ingest import read_csv
+    from app.llm_tools.metrics import Trace
+    from app.llm_tools.finai_llm import generate_report
+
+    path = write_csv(rows, DATA_DIR)
+    trace = Trace('bench')
+    start = time.perf_counter()
+    with trace.stage('ingest'):
+        df = read_csv(path)
+    ingest_seconds = time.perf_counter() - start
+    if plot_mode == 'agent':
+        _use_planned_tool_script(df, model_settings)
+        start += time.perf_counter() - start - ingest_seconds # planning is setup, not report time
+    generate_report(df, trace=trace, plot_mode=plot_mode)
+    total = time.perf_counter() - start
+
+    stages = {}
+    for span in trace.to_dict()['stages']:
+        key = f"stage_{span['stage']}_seconds"
+        # concurrent stages (q-a) are summed, so this is work, not wall time
+        stages[key] = round(stages.get(key, 0.0) + span['seconds'], 4)
+    return {
+        'rows': rows,
+        'csv_mb': round(path.stat().st_size / (1024 * 1024), 2),
+        'ingest_rows_per_s': round(rows / ingest_seconds),
+        'report_seconds': round(total, 4),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        **stages,
+    }
+
+
+def _client(app):
+    # a logged in session without a database user, the routes only check the session
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'bench'
+        session['user_id'] = -1
+    return client
+
+
+def bench_load(rows: int, requests: int, concurrency: int, reports: int) -> dict:
+    import run
+
+    path = write_csv(rows, DATA_DIR)
+    client = _client(run.app)
+    with open(path, 'rb') as f:
+        upload = client.post('/datasets', data={'file': (f, path.name)}, content_type='multipart/form-data')
+    dataset_id = upload.get_json()['dataset_id']
+
+    def chat(i):
+        # one client per request keeps the calls independent; distinct queries skip the result cache
+        start = time.perf_counter()
+        response = _client(run.app).post('/chat', data={'dataset_id': dataset_id, 'query': f'bench question {i} {time.time()}'})
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(chat, range(requests)))
+    chat_wall = time.perf_counter() - start
+    latencies = [seconds for seconds, status in results if status == 200]
+
+    def report(i):
+        report_client = _client(run.app)
+        with open(path, 'rb') as f:
+            # a distinct file name doesn't change the content hash, so only the first one is built
+            data = {'file': (f, f'bench_{i}.csv')}
+            response = report_client.post('/finai_analyzer', data=data, content_type='multipart/form-data',
+                                          headers={'Accept': 'application/json'})
+        job_id = response.get_json()['job_id']
+        while True:
+            status = report_client.get(f'/finai_analyzer/jobs/{job_id}/status').get_json()
+            if status['status'] in ('done', 'failed'):
+                return status['status']
+            time.sleep(0.05)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=reports) as pool:
+        report_results = list(pool.map(report, range(reports)))
+    report_wall = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'chat_requests': requests,
+        'chat_errors': requests - len(latencies),
+        'chat_p50_seconds': round(statistics.median(latencies), 4) if latencies else None,
+        'chat_p95_seconds': round(_percentile(latencies, 0.95), 4) if latencies else None,
+        'chat_throughput_per_s': round(len(latencies) / chat_wall, 3),
+        'report_jobs': reports,
+        'report_failures': report_results.count('failed'),
+        'report_jobs_seconds': round(report_wall, 4),
+    }
+
+
+def _flatten(results: dict, prefix='') -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+# Output: list of (metric, baseline, current, change) that got worse by more than tolerance;
+# metrics ending in _per_s are better when higher, every other timing or size when lower
+def compare(results: dict, baseline: dict, tolerance=TOLERANCE) -> list:
+    current = _flatten(results['benchmarks'])
+    previous = _flatten(baseline['benchmarks'])
+    regressions = []
+    for name, old in previous.items():
+        new = current.get(name)
+        if new is None or not old or not (name.endswith('_seconds') or name.endswith('_mb') or name.endswith('_per_s')):
+            continue
+        change = (new - old) / old
+        worse = -change if name.endswith('_per_s') else change
+        if worse > tolerance:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1k,100k,1m', help=f'comma separated, from {", ".join(SIZES)}')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per fake LLM call')
+    parser.add_argument('--token-latency', type=float, default=0.0, help='seconds per streamed chunk')
+    parser.add_argument('--plot-mode', default='rules', choices=['rules', 'agent'])
+    parser.add_argument('--load-size', default='10k', help='dataset size used for the route load test, "none" skips it')
+    parser.add_argument('--requests', type=int, default=32, help='chat requests in the load test')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--reports', type=int, default=2, help='concurrent report jobs in the load test')
+    parser.add_argument('--out', help='write the results json here (default: stdout)')
+    parser.add_argument('--baseline', help='results json to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    from app.llm_tools.clients import set_chat_model_factory
+    model_settings = {'latency': args.latency, 'token_latency': args.token_latency}
+    set_chat_model_factory(scripted_model_factory(**model_settings))
+    work_dir = Path(tempfile.mkdtemp(prefix='finai-bench-'))
+    _isolate_storage(work_dir)
+
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    # the first report starts the sandbox and chart render processes, measured on its own
+    print('warm up...', file=sys.stderr)
+    start = time.perf_counter()
+    bench_report(SIZES['1k'], args.plot_mode, model_settings)
+    benchmarks = {'cold_start': {'report_seconds': round(time.perf_counter() - start, 4)}}
+    for size in sorted(sizes, key=lambda size: SIZES[size]):
+        print(f'report {size}...', file=sys.stderr)
+        benchmarks[f'report_{size}'] = bench_report(SIZES[size], args.plot_mode, model_settings)
+    if args.load_size != 'none':
+        print(f'load {args.load_size}...', file=sys.stderr)
+        benchmarks[f'load_{args.load_size}'] = bench_load(SIZES[args.load_size], args.requests, args.concurrency, args.reports)
+
+    results = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency': args.latency,
+            'plot_mode': args.plot_mode,
+        },
+        'benchmarks': benchmarks,
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for name, old, new, change in regressions:
+            print(f'REGRESSION {name}: {old} -> {new} ({change:+.0%})', file=sys.stderr)
+        if regressions:
+            return 1
+        print('no regressions against the baseline', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORIES = [
+    'Groceries', 'Rent', 'Utilities', 'Payroll', 'Travel', 'Dining', 'Software',
+    'Insurance', 'Healthcare', 'Marketing', 'Equipment', 'Taxes',
+]
+CATEGORY_WEIGHTS = np.linspace(2, 0.5, len(CATEGORIES)) / np.linspace(2, 0.5, len(CATEGORIES)).sum()
+REGIONS = ['North', 'South', 'East', 'West', 'Central', 'International']
+CURRENCIES = ['USD', 'EUR', 'GBP']
+MISSING_SHARE = 0.02 # share of missing values in the columns that may be empty
+
+
+# Input: number of rows and a seed
+# Output: ledger-like frame (dates, ids, categoricals, skewed amounts, free text, some gaps)
+def make_transactions(rows: int, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    amount = np.round(rng.lognormal(mean=4, sigma=1.2, size=rows), 2)
+    credit = rng.random(rows) < 0.3
+    df = pd.DataFrame({
+        'transaction_id': np.arange(1, rows + 1),
+        'date': pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, rows), unit='D'),
+        'account_id': rng.integers(1000, 1000 + max(rows // 50, 10), rows),
+        'category': rng.choice(CATEGORIES, rows, p=CATEGORY_WEIGHTS),
+        'region': rng.choice(REGIONS, rows),
+        'merchant': np.char.add('Merchant ', rng.integers(0, max(rows // 20, 50), rows).astype(str)),
+        'currency': rng.choice(CURRENCIES, rows, p=[0.8, 0.15, 0.05]),
+        'amount': np.where(credit, amount, -amount),
+        'quantity': rng.integers(1, 20, rows),
+        'status': rng.choice(['posted', 'pending', 'reversed'], rows, p=[0.9, 0.08, 0.02]),
+    })
+    df['unit_price'] = np.round(np.abs(df['amount']) / df['quantity'], 2)
+    for col in ('region', 'status', 'unit_price'):
+        df.loc[rng.random(rows) < MISSING_SHARE, col] = None
+    return df
+
+
+# Output: path of the csv for this size, written once and reused by later runs
+def write_csv(rows: int, directory: Path, seed=0) -> Path:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'transactions_{rows}_{seed}.csv'
+    if not path.exists():
+        make_transactions(rows, seed).to_csv(path, index=False)
+    return path
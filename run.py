@@ -1,12 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import pandas as pd
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, send_from_directory
 import app
-from app.llm_tools.finai_llm import generate_report, answer_finai
+from app.llm_tools.settings import DEFAULT_MODEL
+from app.report_jobs import submit_report, get_job, job_status, job_sections
+from app import result_cache
+from app.dataset_store import add_dataset, get_dataset, drop_user_datasets
+from app.llm_tools.chart_store import CHART_DIR, CHART_URL_PREFIX, MIMETYPES, add_reference_source
+from app.llm_tools.formats import file_format, UPLOAD_ACCEPT, UPLOAD_HINT
+from app.prewarm import start_prewarm
+from app.history_store import CompressedText, set_sqlite_pragmas, paginate, page_size
 from markdown2 import markdown
-import traceback
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from datetime import datetime
+from threading import Event, Lock
+import json
+import uuid
+import os
 import re
 
 
@@ -17,7 +27,8 @@ app = Flask(
 
 app.secret_key = "your_secret_key"
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///FinAI.sqlite3'
+# FINAI_DATABASE_URI points the app at another database, e.g. the benchmarks' temp dir
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FINAI_DATABASE_URI', 'sqlite:///FinAI.sqlite3')
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
@@ -48,6 +59,212 @@ class Feedback(db.Model):
     request_id = db.Column(db.Integer, unique=True, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user_demographics.id'), nullable=False)
 
+# History of uploaded files, generated reports and chat answers, so an old analysis
+# can be reopened without running the LLM pipeline again. Listings go through the
+# (user, created_at) indexes; html bodies are stored zlib compressed and deferred,
+# so listing rows never loads them.
+class Dataset(db.Model):
+    __tablename__ = 'datasets'
+    __table_args__ = (
+        db.Index('ix_datasets_user_created', 'user_id', 'created_at'),
+        db.UniqueConstraint('user_id', 'file_hash', name='uq_datasets_user_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user_demographics.id'), nullable=False)
+    filename = db.Column(db.String(255))
+    file_hash = db.Column(db.String(64), nullable=False) # sha256 of the uploaded file
+    size_bytes = db.Column(db.Integer)
+    row_count = db.Column(db.Integer)
+    column_count = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "file_hash": self.file_hash,
+            "size_bytes": self.size_bytes,
+            "rows": self.row_count,
+            "columns": self.column_count,
+            "created_at": self.created_at.isoformat(),
+        }
+
+class Report(db.Model):
+    __tablename__ = 'reports'
+    __table_args__ = (
+        db.Index('ix_reports_user_created', 'user_id', 'created_at'),
+        db.Index('ix_reports_hash_model', 'file_hash', 'model'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user_demographics.id'), nullable=False)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), index=True)
+    job_id = db.Column(db.String(32), unique=True)
+    filename = db.Column(db.String(255))
+    file_hash = db.Column(db.String(64), nullable=False)
+    model = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False) # 'done' or 'failed'
+    error = db.Column(db.Text)
+    cached = db.Column(db.Boolean, nullable=False, default=False)
+    html = db.deferred(db.Column(CompressedText))
+    html_bytes = db.Column(db.Integer) # uncompressed size
+    section_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+    sections = db.relationship('ReportSection', order_by='ReportSection.position',
+                               cascade='all, delete-orphan', lazy='select')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "dataset_id": self.dataset_id,
+            "filename": self.filename,
+            "file_hash": self.file_hash,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "cached": self.cached,
+            "html_bytes": self.html_bytes,
+            "sections": self.section_count,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+# answers and charts in the order the progress page showed them
+class ReportSection(db.Model):
+    __tablename__ = 'report_sections'
+    __table_args__ = (
+        db.UniqueConstraint('report_id', 'position', name='uq_report_sections_position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('reports.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False) # 'answer' or 'chart'
+    html = db.Column(CompressedText, nullable=False)
+
+class ChatTurn(db.Model):
+    __tablename__ = 'chat_turns'
+    __table_args__ = (
+        db.Index('ix_chat_turns_user_created', 'user_id', 'created_at'),
+        db.Index('ix_chat_turns_dataset_created', 'dataset_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user_demographics.id'), nullable=False)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'))
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(CompressedText, nullable=False) # markdown
+    model = db.Column(db.String(50), nullable=False)
+    cached = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "dataset_id": self.dataset_id,
+            "question": self.question,
+            "answer": self.answer,
+            "model": self.model,
+            "cached": self.cached,
+            "created_at": self.created_at.isoformat(),
+        }
+
+# WAL mode and tuned pragmas on every connection, so history reads don't wait on
+# report workers writing (see history_store.SQLITE_PRAGMAS); the tables are created
+# here rather than under __main__ so WSGI servers get the history tables as well
+with app.app_context():
+    event.listen(db.engine, "connect", set_sqlite_pragmas)
+    db.create_all()
+
+# History writes never fail the request that triggered them, errors are only logged
+def save_history(*rows):
+    try:
+        db.session.add_all(rows)
+        db.session.commit()
+        return True
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        app.logger.error(f"Could not save history: {e}")
+        return False
+
+# Output: id of the user's history row for this file (one per user and content hash), None without a user
+def record_dataset(user_id, filename, file_hash, size_bytes=None, row_count=None, column_count=None):
+    if user_id is None:
+        return None
+    try:
+        dataset = Dataset.query.filter_by(user_id=user_id, file_hash=file_hash).first()
+        if dataset is None:
+            dataset = Dataset(user_id=user_id, file_hash=file_hash, size_bytes=size_bytes)
+            db.session.add(dataset)
+        dataset.filename = filename
+        dataset.row_count = row_count if row_count is not None else dataset.row_count
+        dataset.column_count = column_count if column_count is not None else dataset.column_count
+        db.session.commit()
+        return dataset.id
+    except IntegrityError:
+        # a concurrent upload of the same file inserted the row first, that one is ours too
+        db.session.rollback()
+        try:
+            dataset = Dataset.query.filter_by(user_id=user_id, file_hash=file_hash).first()
+            return dataset.id if dataset else None
+        except SQLAlchemyError as e:
+            app.logger.error(f"Could not read history: {e}")
+            return None
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        app.logger.error(f"Could not save history: {e}")
+        return None
+
+def save_chat_turn(user_id, dataset, query, answer, cached):
+    if user_id is None:
+        return
+    save_history(ChatTurn(
+        user_id=user_id,
+        dataset_id=dataset.get("record_id"),
+        question=query,
+        answer=answer,
+        model=DEFAULT_MODEL,
+        cached=cached,
+    ))
+
+# on_finish of report jobs, runs on the report worker thread
+def save_report(job, dataset_id=None, file_hash=None):
+    if job["user_id"] is None:
+        return
+    with app.app_context():
+        report = Report(
+            user_id=job["user_id"],
+            dataset_id=dataset_id,
+            job_id=job["id"],
+            filename=job["filename"],
+            file_hash=file_hash,
+            model=job["model"],
+            status=job["status"],
+            error=job["error"],
+            cached=job["cached"],
+            html=job["result"],
+            html_bytes=len(job["result"].encode("utf-8")) if job["result"] else None,
+            section_count=len(job["sections"]),
+            created_at=datetime.fromtimestamp(job["created"]),
+            finished_at=datetime.fromtimestamp(job["finished"]),
+        )
+        report.sections = [
+            ReportSection(position=i, kind=section["kind"], html=section["html"])
+            for i, section in enumerate(job["sections"])
+        ]
+        save_history(report)
+
+# Output: every saved report, section and chat answer, so chart pruning keeps the charts
+# old analyses link to; called from chart_store on the thread that saved a chart
+def history_chart_texts():
+    with app.app_context():
+        for column in (Report.html, ReportSection.html, ChatTurn.answer):
+            yield from db.session.scalars(db.select(column).execution_options(yield_per=200))
+
+add_reference_source(history_chart_texts)
+add_reference_source(lambda: result_cache.values_containing(CHART_URL_PREFIX))
 
 
 # Route: Main Page
@@ -150,11 +367,12 @@ def signup():
 def dashboard():
     if "username" not in session:
         return redirect(url_for("login"))
-    return render_template("dashboard.html", username=session["username"])
+    return render_template("dashboard.html", username=session["username"], upload_accept=UPLOAD_ACCEPT)
 
 # Route: Logout
 @app.route("/logout")
 def logout():
+    drop_user_datasets(session.get("user_id"))
     session.pop("username", None)
     return redirect(url_for("index"))
 
@@ -206,32 +424,206 @@ def finai_calculator():
         return redirect(url_for("login"))
     return render_template("finai_calculator.html")
 
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+# Output: value when it is a JSON object whose values all pass is_valid; ValueError
+# (a 400 answer) for lists, strings and other JSON that fin_calc can't take
+def _json_object(value, name, is_valid=lambda v: True, expected="values"):
+    if not isinstance(value, dict) or not all(is_valid(v) for v in value.values()):
+        raise ValueError(f"{name} must be a JSON object of {expected}")
+    return value
+
+# Route: calculator formulas over many inputs at once
+# JSON {"formula", "inputs": {input: number or list}} -> results per row;
+# JSON {"formula", "grid": {input: values}, "inputs": {...}, "format": "json" or "csv"} -> every combination;
+# multipart csv file with form fields formula, columns and constants (JSON objects) -> the csv with a result column
+@app.route("/api/calculator/batch", methods=["POST"])
+def calculator_batch():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    from app.llm_tools import fin_calc
+
+    file = request.files.get("file")
+    try:
+        if file:
+            from app.llm_tools.ingest import read_upload
+            key = request.form.get("formula")
+            columns = _json_object(json.loads(request.form.get("columns") or "{}"), "columns",
+                                   lambda v: isinstance(v, str), "column names")
+            constants = _json_object(json.loads(request.form.get("constants") or "{}"), "constants",
+                                     _is_number, "numbers")
+            as_json = request.accept_mimetypes.best == "application/json"
+            # a JSON answer only needs the formula's columns, the csv answer echoes every column
+            needed = sorted(set(fin_calc.input_columns(key, columns, constants).values())) if as_json else None
+            df, _ = read_upload(file, narrow=False, columns=needed)
+            results = fin_calc.calculate_frame(df, key, columns=columns, constants=constants)
+            if as_json:
+                return jsonify({"formula": key, "rows": len(df), "results": fin_calc.to_json_values(results.to_numpy())})
+            df[request.form.get("output_column") or key] = results
+            return Response(df.to_csv(index=False), mimetype="text/csv",
+                            headers={"Content-Disposition": f"attachment; filename={key}.csv"})
+
+        body = _json_object(request.get_json(silent=True) or {}, "The request body")
+        key = body.get("formula")
+        inputs = _json_object(body.get("inputs") or {}, "inputs")
+        name, _, _, unit = fin_calc.FORMULAS.get(key, (None, None, None, None))
+        if "grid" in body:
+            axes, results = fin_calc.calculate_grid(key, _json_object(body["grid"], "grid"), inputs)
+            if body.get("format") == "csv":
+                frame = fin_calc.grid_frame(key, body["grid"], results)
+                return Response(frame.to_csv(index=False), mimetype="text/csv",
+                                headers={"Content-Disposition": f"attachment; filename={key}_grid.csv"})
+            return jsonify({"formula": key, "name": name, "unit": unit, "axes": axes,
+                            "shape": list(results.shape), "results": fin_calc.to_json_values(results)})
+        results = fin_calc.calculate(key, **inputs)
+        return jsonify({"formula": key, "name": name, "unit": unit, "results": fin_calc.to_json_values(results)})
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": str(e)}), 400
+
 # Route: Ask FinAI
 @app.route("/ask_finai")
 def ask_finai():
     if "username" not in session:
         return redirect(url_for("login"))
-    return render_template("ask_finai.html")
-
-@app.route("/chat", methods=["POST"])
-def chat():
-    df = None
+    return render_template("ask_finai.html", upload_accept=UPLOAD_ACCEPT)
+
+# parses and hashes the upload in one pass and keeps the frame for later chat turns
+def store_uploaded_dataset(file):
+    from app.llm_tools.ingest import read_upload
+    df, file_hash = read_upload(file)
+    record_id = record_dataset(session.get("user_id"), file.filename, file_hash,
+                               row_count=len(df), column_count=len(df.columns))
+    return add_dataset(
+        df,
+        user_id=session.get("user_id"),
+        filename=file.filename,
+        file_hash=file_hash,
+        record_id=record_id
+    )
+
+# Route: upload a dataset once and chat about it by id
+@app.route("/datasets", methods=["POST"])
+def upload_dataset():
     file = request.files.get("file")
+    if not file or file_format(file.filename) is None:
+        return jsonify({"error": UPLOAD_HINT}), 400
+    try:
+        dataset_id = store_uploaded_dataset(file)
+    except ValueError as e:
+        return jsonify({"error": f"Could not read the file: {e}"}), 400
+    dataset = get_dataset(dataset_id, user_id=session.get("user_id"))
+    return jsonify({
+        "dataset_id": dataset_id,
+        "filename": dataset["filename"],
+        "rows": len(dataset["df"]),
+        "columns": len(dataset["df"].columns),
+    })
+
+# Input: the chat form (file or dataset_id, query)
+# Output: (dataset dict, query, None) or (None, None, error response)
+def resolve_chat_request():
+    file = request.files.get("file")
+    dataset_id = request.form.get("dataset_id")
     query = request.form.get("query")
 
-    if not file or not file.filename.endswith(".csv"):
-        return jsonify({"error": "Please upload a valid CSV file."})
-    else:
-        df = pd.read_csv(file)
+    # a new file replaces the conversation's dataset, otherwise reuse the stored one
+    if file:
+        if file_format(file.filename) is None:
+            return None, None, jsonify({"error": UPLOAD_HINT})
+        try:
+            dataset_id = store_uploaded_dataset(file)
+        except ValueError as e:
+            return None, None, jsonify({"error": f"Could not read the file: {e}"})
+    elif not dataset_id:
+        return None, None, jsonify({"error": "No CSV file uploaded yet."})
 
-    if df is None:
-        return jsonify({"error": "No CSV file uploaded yet."})
+    dataset = get_dataset(dataset_id, user_id=session.get("user_id"))
+    if dataset is None:
+        return None, None, (jsonify({"error": "Your dataset expired, please attach the file again.", "dataset_missing": True}), 404)
 
     if not query:
-        return jsonify({"error": "No query provided."})
+        return None, None, jsonify({"error": "No query provided.", "dataset_id": dataset_id})
+    return dataset, query, None
 
-    response = markdown(answer_finai(df=df, query=query))
-    return jsonify({"response": response})
+@app.route("/chat", methods=["POST"])
+def chat():
+    dataset, query, error = resolve_chat_request()
+    if error is not None:
+        return error
+
+    # same file + same question -> reuse the stored answer instead of re-running the agent
+    cache_key = result_cache.make_key("chat", dataset["file_hash"], DEFAULT_MODEL, query)
+    answer = result_cache.get(cache_key, "chat")
+    cached = answer is not None
+    if not cached:
+        from app.llm_tools.finai_llm import answer_finai
+        answer = answer_finai(df=dataset["df"], query=query, user=session.get("user_id"))
+        result_cache.put(cache_key, "chat", answer)
+    save_chat_turn(session.get("user_id"), dataset, query, answer, cached)
+
+    response = markdown(answer)
+    return jsonify({"response": response, "dataset_id": dataset["id"]})
+
+# streams in progress, so a client can cancel one explicitly: stream_id -> (user_id, cancel event)
+chat_streams = {}
+chat_streams_lock = Lock()
+
+def sse_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+# Route: Ask FinAI as server-sent events (tool steps and answer tokens as they arrive)
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    dataset, query, error = resolve_chat_request()
+    if error is not None:
+        return error
+
+    stream_id = uuid.uuid4().hex
+    user_id = session.get("user_id") # the generator runs after the request context is gone
+    cache_key = result_cache.make_key("chat", dataset["file_hash"], DEFAULT_MODEL, query)
+    cached = result_cache.get(cache_key, "chat")
+
+    def generate():
+        yield sse_event({"type": "start", "stream_id": stream_id, "dataset_id": dataset["id"]})
+        if cached is not None:
+            save_chat_turn(user_id, dataset, query, cached, True)
+            yield sse_event({"type": "final", "text": cached, "html": markdown(cached)})
+            return
+
+        from app.llm_tools.finai_llm import stream_finai
+        cancel_event = Event()
+        with chat_streams_lock:
+            chat_streams[stream_id] = (user_id, cancel_event)
+        try:
+            # leaving this loop early (client gone) closes stream_finai, which cancels the agent
+            for sse in stream_finai(dataset["df"], query, cancel_event=cancel_event, user=user_id):
+                if sse["type"] == "final":
+                    result_cache.put(cache_key, "chat", sse["text"])
+                    save_chat_turn(user_id, dataset, query, sse["text"], False)
+                    sse["html"] = markdown(sse["text"])
+                yield sse_event(sse)
+        finally:
+            cancel_event.set()
+            with chat_streams_lock:
+                chat_streams.pop(stream_id, None)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Route: stop a streaming answer so it stops spending tokens
+@app.route("/chat/stream/<stream_id>/cancel", methods=["POST"])
+def cancel_chat_stream(stream_id):
+    with chat_streams_lock:
+        owner, cancel_event = chat_streams.get(stream_id, (None, None))
+    # another user's stream answers like an unknown one
+    if cancel_event is None or owner != session.get("user_id"):
+        return jsonify({"cancelled": False}), 404
+    cancel_event.set()
+    return jsonify({"cancelled": True})
 
 
 # Route: FinAI Analyzer
@@ -249,24 +641,151 @@ def finai_analyzer():
         flash("No file selected!")
         return redirect(url_for("dashboard"))
 
-    # Process the file (example: read CSV)
+    if file_format(file.filename) is None:
+        flash(f"Unsupported file format! {UPLOAD_HINT}")
+        return redirect(url_for("dashboard"))
+
+    from app.llm_tools.ingest import spool_upload, UploadTooLarge
     try:
-        if file.filename.endswith(".csv"):
-            file.seek(0)
-            df = pd.read_csv(file)
-        else:
-            flash("Unsupported file format! Please upload a CSV file.")
-            return redirect(url_for("dashboard"))
-        file.seek(0)
-        summary = generate_report(file)
-        return render_template("finai_report.html", summary=summary)
+        csv_path, file_hash = spool_upload(file)
+    except UploadTooLarge as e:
+        flash(str(e))
+        return redirect(url_for("dashboard"))
 
-    except Exception as e:
-        flash(f"Error processing file: {str(e)}")
-        traceback.print_exc()
+    user_id = session.get("user_id")
+    dataset_id = record_dataset(user_id, file.filename, file_hash, size_bytes=os.path.getsize(csv_path))
+
+    # the report is built on the job pool, the request returns right away
+    job_id = submit_report(csv_path, file_hash, user_id=user_id, filename=file.filename,
+                           on_finish=lambda job: save_report(job, dataset_id, file_hash))
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "status_url": url_for("report_job_status", job_id=job_id)}), 202
+    return redirect(url_for("report_job", job_id=job_id))
+
+# Route: FinAI Analyzer job status (polled by the progress page)
+@app.route("/finai_analyzer/jobs/<job_id>/status")
+def report_job_status(job_id):
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    job = get_job(job_id, user_id=session.get("user_id"))
+    if job is None:
+        return jsonify({"error": "Unknown report job."}), 404
+    return jsonify(job_status(job))
+
+# Route: answers and charts of a report in progress (?after=<sections already shown>)
+@app.route("/finai_analyzer/jobs/<job_id>/sections")
+def report_job_sections(job_id):
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    job = get_job(job_id, user_id=session.get("user_id"))
+    if job is None:
+        return jsonify({"error": "Unknown report job."}), 404
+    after = request.args.get("after", 0, type=int)
+    return jsonify({"status": job_status(job), "sections": job_sections(job, max(after, 0))})
+
+# Route: FinAI Analyzer job result (progress page until the report is ready)
+@app.route("/finai_analyzer/jobs/<job_id>")
+def report_job(job_id):
+    if "username" not in session:
+        return redirect(url_for("login"))
+    job = get_job(job_id, user_id=session.get("user_id"))
+    if job is None:
+        flash("Report not found or expired.")
+        return redirect(url_for("dashboard"))
+    if job["status"] == "failed":
+        flash(f"Error processing file: {job['error']}")
         return redirect(url_for("dashboard"))
+    if job["status"] != "done":
+        return render_template("report_progress.html", job=job_status(job))
+    return render_template("finai_report.html", summary=job["result"])
 
+# Input: query of one user's history rows
+# Output: json page of them (?cursor=<next_cursor of the previous page>&limit=N), newest first
+def history_page(query, model, key):
+    try:
+        rows, next_cursor = paginate(query, model, request.args.get("cursor"), page_size(request.args.get("limit", type=int)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({key: [row.to_dict() for row in rows], "next_cursor": next_cursor})
+
+# Route: the user's past reports
+@app.route("/history/reports")
+def report_history():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    return history_page(Report.query.filter_by(user_id=session.get("user_id")), Report, "reports")
+
+# Route: reopen a past report from the database
+@app.route("/history/reports/<int:report_id>")
+def saved_report(report_id):
+    if "username" not in session:
+        return redirect(url_for("login"))
+    report = Report.query.filter_by(id=report_id, user_id=session.get("user_id")).first()
+    if report is None or report.status != "done":
+        flash("Report not found.")
+        return redirect(url_for("dashboard"))
+    return render_template("finai_report.html", summary=report.html)
+
+# Route: answers and charts of a past report, in the order they were produced
+@app.route("/history/reports/<int:report_id>/sections")
+def saved_report_sections(report_id):
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    report = Report.query.filter_by(id=report_id, user_id=session.get("user_id")).first()
+    if report is None:
+        return jsonify({"error": "Unknown report."}), 404
+    return jsonify({"sections": [
+        {"index": section.position, "kind": section.kind, "html": section.html} for section in report.sections
+    ]})
+
+# Route: the user's past chat answers (?dataset_id=<history dataset id> for one file's conversation)
+@app.route("/history/chats")
+def chat_history():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    query = ChatTurn.query.filter_by(user_id=session.get("user_id"))
+    dataset_id = request.args.get("dataset_id", type=int)
+    if dataset_id is not None:
+        query = query.filter_by(dataset_id=dataset_id)
+    return history_page(query, ChatTurn, "chats")
+
+# Route: the files the user has uploaded
+@app.route("/history/datasets")
+def dataset_history():
+    if "username" not in session:
+        return jsonify({"error": "Not logged in."}), 401
+    return history_page(Dataset.query.filter_by(user_id=session.get("user_id")), Dataset, "datasets")
+
+# Route: report charts, named by content hash so they never change and can be cached forever
+@app.route("/charts/<name>")
+def chart_image(name):
+    extension = name.rsplit(".", 1)[-1]
+    if extension not in MIMETYPES:
+        return jsonify({"error": "Unknown chart format."}), 404
+    response = send_from_directory(CHART_DIR, name, mimetype=MIMETYPES[extension], max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+# Route: Prometheus scrape endpoint (stage latencies, token usage, cost, cache counters)
+@app.route("/metrics")
+def metrics():
+    from app.llm_tools.metrics import render_prometheus
+    lines = [render_prometheus()]
+    cache = result_cache.stats()
+    lines.append("# TYPE finai_cache_bytes gauge\nfinai_cache_bytes {}\n".format(cache["bytes"]))
+    lines.append("# TYPE finai_cache_requests_total counter\n")
+    for kind, counts in cache["counts"].items():
+        lines.append('finai_cache_requests_total{{kind="{}",result="hit"}} {}\n'.format(kind, counts["hits"]))
+        lines.append('finai_cache_requests_total{{kind="{}",result="miss"}} {}\n'.format(kind, counts["misses"]))
+    return Response("".join(lines), mimetype="text/plain; version=0.0.4")
+
+
+# Report jobs, chat streams and datasets live in this process's memory (see report_jobs._jobs),
+# so serve the app from a single process; threads are fine, extra worker processes are not
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+    # pandas, langchain and matplotlib are imported by the routes that use them, so
+    # workers serving only the auth pages start fast and stay small; FINAI_PREWARM
+    # loads them in the background instead. Started here, not at import, so the
+    # sandbox and chart processes that re-import this module don't pre-warm too
+    start_prewarm()
     app.run()
\ No newline at end of file
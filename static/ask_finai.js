@@ -1,3 +1,9 @@
+// the server keeps the parsed file, later messages only send its id
+let datasetId = null;
+let uploadedFile = null;
+// the answer currently streaming, a new question or leaving the page cancels it
+let activeStream = null;
+
 function updateFileName() {
     const fileInput = document.getElementById("file");
     const fileName = document.getElementById("fileName");
@@ -9,21 +15,92 @@ function scrollToLatest() {
     chatBox.scrollTo({ top: chatBox.scrollHeight, behavior: "smooth" });
 }
 
+function buildChatForm(query, forceUpload) {
+    const fileInput = document.getElementById("file");
+    const file = fileInput.files.length > 0 ? fileInput.files[0] : null;
+    const formData = new FormData();
+    if (file && (forceUpload || file !== uploadedFile || !datasetId)) {
+        formData.append("file", file);
+    } else if (datasetId) {
+        formData.append("dataset_id", datasetId);
+    }
+    formData.append("query", query);
+    return { formData, file };
+}
+
+function cancelActiveStream() {
+    if (!activeStream) {
+        return;
+    }
+    if (activeStream.streamId) {
+        navigator.sendBeacon(`/chat/stream/${activeStream.streamId}/cancel`);
+    }
+    activeStream.controller.abort();
+    activeStream = null;
+}
+
+async function openStream(query, controller) {
+    let { formData, file } = buildChatForm(query, false);
+    let response = await fetch("/chat/stream", { method: "POST", body: formData, signal: controller.signal });
+    if (response.status === 404 && file) {
+        // the stored dataset expired, upload the attached file again
+        ({ formData, file } = buildChatForm(query, true));
+        response = await fetch("/chat/stream", { method: "POST", body: formData, signal: controller.signal });
+    }
+    return { response, file };
+}
+
+// Calls handlers[event.type](event) for every server-sent event in the response body
+async function readEvents(response, handlers) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const chunks = buffer.split("\n\n");
+        buffer = chunks.pop();
+        for (const chunk of chunks) {
+            const data = chunk.split("\n").find((line) => line.startsWith("data: "));
+            if (!data) {
+                continue;
+            }
+            const event = JSON.parse(data.slice(6));
+            if (handlers[event.type]) {
+                handlers[event.type](event);
+            }
+        }
+    }
+}
+
+function createBotMessage() {
+    const botMessage = document.createElement("div");
+    botMessage.className = "message bot";
+    botMessage.innerHTML = `
+        <div class="chat-steps"></div>
+        <div class="chat-answer">
+            <span>typing</span>
+            <span class="typing-dots">
+                <span class="dot"></span>
+                <span class="dot"></span>
+                <span class="dot"></span>
+            </span>
+        </div>`;
+    return botMessage;
+}
+
 document.getElementById("chat-form").addEventListener("submit", async (event) => {
     event.preventDefault();
 
-    const fileInput = document.getElementById("file");
     const queryInput = document.getElementById("query");
     const chatBox = document.getElementById("chat-box");
     const query = queryInput.value.trim();
 
     queryInput.value = "";
-
-    const formData = new FormData();
-    if (fileInput.files.length > 0) {
-        formData.append("file", fileInput.files[0]);
-    }
-    formData.append("query", query);
+    cancelActiveStream();
 
     const userMessage = document.createElement("div");
     userMessage.className = "message user";
@@ -31,32 +108,65 @@ document.getElementById("chat-form").addEventListener("submit", async (event) =>
     chatBox.prepend(userMessage);
     scrollToLatest();
 
-    const loadingMessage = document.createElement("div");
-    loadingMessage.className = "message bot";
-    loadingMessage.innerHTML = `
-        <span>typing</span>
-        <span class="typing-dots">
-            <span class="dot"></span>
-            <span class="dot"></span>
-            <span class="dot"></span>
-        </span>`;
-    chatBox.prepend(loadingMessage);
+    const botMessage = createBotMessage();
+    const steps = botMessage.querySelector(".chat-steps");
+    const answer = botMessage.querySelector(".chat-answer");
+    chatBox.prepend(botMessage);
     scrollToLatest();
 
+    let streamedText = "";
+    const stream = { controller: new AbortController(), streamId: null };
+    activeStream = stream;
     try {
-        const response = await fetch("/chat", { method: "POST", body: formData });
-        const result = await response.json();
-        loadingMessage.remove();
-
-        const botMessage = document.createElement("div");
-        botMessage.className = "message bot";
-        botMessage.innerHTML = result.response || `<span>${result.error || "Unexpected error"}</span>`;
-        chatBox.prepend(botMessage);
+        const { response, file } = await openStream(query, stream.controller);
+        const contentType = response.headers.get("Content-Type") || "";
+        if (!contentType.startsWith("text/event-stream")) {
+            const result = await response.json();
+            answer.innerHTML = `<span>${result.error || "Unexpected error"}</span>`;
+            return;
+        }
+
+        await readEvents(response, {
+            start: (e) => {
+                stream.streamId = e.stream_id;
+                datasetId = e.dataset_id;
+                uploadedFile = file;
+            },
+            step: (e) => {
+                // text streamed before a tool call was the agent thinking, not the answer
+                const step = document.createElement("div");
+                step.className = "chat-step";
+                step.textContent = `Running ${e.tool}...`;
+                steps.appendChild(step);
+                streamedText = "";
+                answer.textContent = "";
+            },
+            token: (e) => {
+                streamedText += e.text;
+                answer.textContent = streamedText;
+            },
+            final: (e) => {
+                steps.remove();
+                answer.innerHTML = e.html;
+            },
+            error: (e) => {
+                answer.innerHTML = `<span>${e.text || "Unexpected error"}</span>`;
+            },
+            cancelled: () => {
+                answer.innerHTML = "<span>Cancelled.</span>";
+            },
+        });
     } catch (error) {
-        loadingMessage.remove();
-        const errorMessage = document.createElement("div");
-        errorMessage.className = "message bot";
-        errorMessage.textContent = "Failed to fetch response.";
-        chatBox.prepend(errorMessage);
+        if (error.name !== "AbortError") {
+            answer.textContent = "Failed to fetch response.";
+        } else {
+            answer.textContent = "Cancelled.";
+        }
+    } finally {
+        if (activeStream === stream) {
+            activeStream = null;
+        }
     }
-});
\ No newline at end of file
+});
+
+window.addEventListener("pagehide", cancelActiveStream);